@@ -0,0 +1,246 @@
+"""
+Scaling benchmarks for the ICE-AGE loaders and renderers.
+
+For every scale (icebergs per date pair) a synthetic catalog is generated with
+benchmarks.synthetic_catalog, then each benchmark runs in its own Python process so
+that its peak RSS is not polluted by the others. Wall time, peak RSS and the size of
+the produced payload (PNG bytes, map HTML) are written to a JSON report.
+
+From the repository root:
+
+    python -m benchmarks.run_benchmarks --scales 10 100 1000 10000 --output bench_output.json
+    python -m benchmarks.run_benchmarks --scales 100 --only iceberg_map overview_map
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SCALES = [10, 100, 1000, 10000]
+
+
+def png_size(fig):
+    import matplotlib.pyplot as plt
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight", dpi=200)
+    plt.close(fig)
+    return len(buffer.getvalue())
+
+
+def first_date_pair():
+    from modules.catalog import catalog_date_pairs, catalog_icebergs, catalog_sites, load_catalog
+
+    catalog = load_catalog()
+    site = catalog_sites(catalog)[0]
+    date_pair = catalog_date_pairs(catalog, site)[0]
+    return site, date_pair, catalog_icebergs(catalog, site, date_pair)
+
+
+# Every benchmark is a (setup, run) pair: setup is not timed and returns the arguments of
+# run, which returns the payload size in bytes (or None).
+
+def setup_catalog_build():
+    from modules.data_path import CATALOG_INDEX_PATH
+
+    if os.path.exists(CATALOG_INDEX_PATH):
+        os.remove(CATALOG_INDEX_PATH)
+    return ()
+
+
+def run_catalog_build():
+    from modules.catalog import build_catalog
+    from modules.data_path import CATALOG_INDEX_PATH
+
+    build_catalog(full=True)
+    return os.path.getsize(CATALOG_INDEX_PATH)
+
+
+def setup_catalog_index():
+    from modules.cache import invalidate
+    from modules.catalog import build_catalog
+    from modules.data_path import CATALOG_INDEX_PATH
+
+    # The timed load must read the index file, so it is only built here and never cached
+    if not os.path.exists(CATALOG_INDEX_PATH):
+        build_catalog()
+    invalidate()
+    return ()
+
+
+def run_load_catalog():
+    from modules.catalog import load_catalog
+
+    load_catalog()
+
+
+def setup_date_pair():
+    return first_date_pair()
+
+
+def run_dominant_angle(site, date_pair, icebergs):
+    from modules.plotting import calculate_dominant_angle
+
+    calculate_dominant_angle(icebergs)
+
+
+def run_iceberg_quartiles(site, date_pair, icebergs):
+    from modules.figure_cache import PANEL_INCHES, figure_quartiles
+    from modules.plotting import iceberg_quartiles
+
+    return png_size(iceberg_quartiles(figure_quartiles(icebergs), PANEL_INCHES))
+
+
+def run_iceberg_grid(site, date_pair, icebergs):
+    from modules.figure_cache import PANEL_INCHES, figure_quartiles
+    from modules.plotting import iceberg_grid
+
+    return png_size(iceberg_grid(figure_quartiles(icebergs), date_pair.split("-")[0], panel_inches=PANEL_INCHES))
+
+
+def run_iceberg_map(site, date_pair, icebergs):
+    from modules.loaders import load_glacier_sites
+    from modules.maps import iceberg_map
+
+    early_date, later_date = date_pair.split("-")
+    m = iceberg_map(load_glacier_sites(), site, early_date, later_date)
+    return len(m.get_root().render().encode())
+
+
+def run_overview_map():
+    from modules.maps import build_overview_map
+
+    return len(build_overview_map("CartoDB positron").get_root().render().encode())
+
+
+def run_distribution_plot():
+    from modules.plotting import distribution_plot
+
+    return png_size(distribution_plot().gcf())
+
+
+def run_correlogram(site, date_pair, icebergs):
+    from modules.loaders import load_melt_rates, melt_rates_path
+    from modules.plotting import correlogram
+
+    return png_size(correlogram(load_melt_rates(melt_rates_path(site, *date_pair.split("-")))))
+
+
+def run_viewer_page():
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(REPO_ROOT, "pages", "Iceberg-shapefile-viewer.py"), default_timeout=3600)
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+
+def setup_catalog():
+    from modules.catalog import load_catalog
+
+    load_catalog()
+    return ()
+
+
+BENCHMARKS = {
+    "catalog_build": (setup_catalog_build, run_catalog_build),
+    "load_catalog": (setup_catalog_index, run_load_catalog),
+    "calculate_dominant_angle": (setup_date_pair, run_dominant_angle),
+    "iceberg_quartiles": (setup_date_pair, run_iceberg_quartiles),
+    "iceberg_grid": (setup_date_pair, run_iceberg_grid),
+    "iceberg_map": (setup_date_pair, run_iceberg_map),
+    "overview_map": (setup_catalog, run_overview_map),
+    "distribution_plot": (setup_catalog, run_distribution_plot),
+    "correlogram": (setup_date_pair, run_correlogram),
+    "viewer_page": (setup_catalog, run_viewer_page),
+}
+
+
+def run_one(name, data_root):
+    """
+    Run a single benchmark in this process (called in a fresh subprocess) and return
+    its measurements.
+    """
+    os.chdir(data_root)
+    sys.path.insert(0, REPO_ROOT)
+    setup, run = BENCHMARKS[name]
+
+    args = setup()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    payload = run(*args)
+    seconds = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 if sys.platform != "darwin" else 1024 * 1024
+    return {
+        "seconds": round(seconds, 4),
+        "peak_rss_mb": round(rss_after / scale, 1),
+        "peak_rss_growth_mb": round((rss_after - rss_before) / scale, 1),
+        "payload_bytes": payload,
+    }
+
+
+def run_isolated(name, data_root):
+    process = subprocess.run(
+        [sys.executable, "-m", "benchmarks.run_benchmarks", "--run-one", name, "--data", data_root],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if process.returncode != 0:
+        return {"error": process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "failed"}
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ICE-AGE loaders and renderers on synthetic catalogs.")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="Icebergs per date pair.")
+    parser.add_argument("--vertices", type=int, default=40, help="Vertices per iceberg outline.")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="Run only these benchmarks.")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--workdir", help="Keep the synthetic catalogs here instead of a temporary folder.")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    parser.add_argument("--data", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_one(args.run_one, args.data)))
+        return
+
+    from benchmarks.synthetic_catalog import generate
+
+    names = args.only or list(BENCHMARKS)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        for scale in args.scales:
+            data_root = os.path.join(workdir, f"icebergs-{scale}")
+            if not os.path.exists(os.path.join(data_root, "catalog-data")):
+                generate(data_root, icebergs=scale, vertices=args.vertices)
+
+            for name in names:
+                result = {"benchmark": name, "icebergs": scale, **run_isolated(name, data_root)}
+                results.append(result)
+                print(json.dumps(result))
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "vertices": args.vertices,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Cold-start benchmark of the Streamlit app.
+
+Every page is rendered with Streamlit's AppTest in a fresh Python process, the way a
+newly started container serves its first request. Reported per page:
+
+    import_streamlit_s   importing streamlit itself (paid by every page)
+    first_run_s          first render, including every import the page triggers
+    rerun_s              a second render in the same process (imports and caches warm)
+    heavy_modules        which of the heavy libraries the first render imported
+
+The data is a small synthetic catalog (benchmarks.synthetic_catalog) unless --data
+points at a folder containing catalog-data/. From the repository root:
+
+    python -m benchmarks.startup --output startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGES = [
+    "streamlit_app.py",
+    "pages/Home.py",
+    "pages/Iceberg-shapefile-viewer.py",
+    "pages/Iceberg-spatial-distributions.py",
+    "pages/Statistics-dashboard.py",
+]
+
+HEAVY_MODULES = [
+    "geopandas", "shapely", "pyproj", "pyogrio", "folium", "streamlit_folium", "matplotlib",
+    "seaborn", "scipy", "graphviz", "mapbox_vector_tile", "pyarrow",
+]
+
+
+def run_one(page, data_root):
+    """
+    Render `page` twice in this (fresh) process and return the timings.
+    """
+    os.chdir(data_root)
+    sys.path.insert(0, REPO_ROOT)
+
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    import_streamlit = time.perf_counter() - start
+    already_loaded = {name for name in HEAVY_MODULES if name in sys.modules}
+
+    app = AppTest.from_file(os.path.join(REPO_ROOT, page), default_timeout=600)
+    start = time.perf_counter()
+    app.run()
+    first_run = time.perf_counter() - start
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+    start = time.perf_counter()
+    app.run()
+    rerun = time.perf_counter() - start
+
+    return {
+        "import_streamlit_s": round(import_streamlit, 3),
+        "first_run_s": round(first_run, 3),
+        "rerun_s": round(rerun, 3),
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules and name not in already_loaded],
+    }
+
+
+def run_isolated(page, data_root):
+    process = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--run-one", page, "--data", data_root],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if process.returncode != 0:
+        return {"error": process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "failed"}
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start and first-page time of every page.")
+    parser.add_argument("--pages", nargs="+", default=PAGES, help="Scripts to render, relative to the repository.")
+    parser.add_argument("--data", help="Folder containing catalog-data/ (default: a small synthetic catalog).")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh processes per page; the fastest is kept.")
+    parser.add_argument("--output", default="startup.json")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_one(args.run_one, args.data)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_root = args.data
+        if data_root is None:
+            from benchmarks.synthetic_catalog import generate
+
+            data_root = tmp
+            generate(data_root, icebergs=50)
+            # Build the catalog and caches once, so pages measure startup rather than ingest
+            run_isolated(PAGES[0], data_root)
+
+        results = []
+        for page in args.pages:
+            runs = [run_isolated(page, data_root) for _ in range(args.repeat)]
+            ok = [run for run in runs if "error" not in run]
+            result = {"page": page, **(min(ok, key=lambda run: run["first_run_s"]) if ok else runs[0])}
+            results.append(result)
+            print(json.dumps(result))
+
+    with open(args.output, "w") as f:
+        json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
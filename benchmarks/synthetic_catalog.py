@@ -0,0 +1,147 @@
+"""
+Synthetic ICE-AGE catalog generator.
+
+Writes a `catalog-data` folder with the same layout and file formats as the real one:
+
+    catalog-data/iceberg-shapefiles/<site>/<early>-<later>/<site>_<date>_<n>.shp
+    catalog-data/Melt-rates/<site>/<early>-<later>/<site>_<early>-<later>_iceberg_meltinfo.csv
+    catalog-data/Glacier-Locations.csv
+    catalog-data/abbreviations-datepairings.csv
+    catalog-data/ne_110m_admin_0_countries.zip      (a stand-in Greenland outline)
+
+Every app path in modules.data_path is relative, so running the app or the benchmarks
+from the output folder uses the synthetic data. From the repository root:
+
+    python -m benchmarks.synthetic_catalog /tmp/ice-age-synthetic --sites 2 --date-pairs 3 --icebergs 500
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import zipfile
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import Transformer
+
+REGIONS = ["SE", "CE", "CW", "NW", "NE", "NO", "SW"]
+
+# Real site IDs first, the pages default to some of them
+SITE_IDS = ["NOG", "KOG", "SEK", "ASG"]
+
+# Melt-rate table columns, the first ones are those the dashboard drops before correlating
+MELT_COLUMNS = [
+    "X_i", "Y_i", "TimeSeparation", "VerticalAdjustment_i", "VerticalAdjustment_f", "Density_i", "Density_f",
+    "SurfaceArea", "SubmergedArea", "Draft", "VolumeChange", "MeltRate",
+]
+
+
+def iceberg_outlines(rng, count, vertices, center, spread=5000.0):
+    """
+    `count` star-shaped (always valid) polygons with `vertices` vertices each, scattered
+    around `center` (EPSG:3413 meters), built in one NumPy pass.
+    """
+    angles = np.sort(rng.uniform(0, 2 * np.pi, (count, vertices)), axis=1)
+    size = rng.lognormal(np.log(150), 0.6, (count, 1))
+    radii = size * rng.uniform(0.7, 1.0, (count, vertices))
+    elongation = rng.uniform(1.0, 2.5, (count, 1))
+    rotation = rng.uniform(0, np.pi, (count, 1))
+
+    x, y = elongation * radii * np.cos(angles), radii * np.sin(angles)
+    x, y = x * np.cos(rotation) - y * np.sin(rotation), x * np.sin(rotation) + y * np.cos(rotation)
+    offsets = center + rng.uniform(-spread, spread, (count, 2))
+
+    coords = np.stack([x + offsets[:, :1], y + offsets[:, 1:]], axis=-1)
+    coords = np.concatenate([coords, coords[:, :1]], axis=1)  # close the rings
+    return shapely.polygons(coords)
+
+
+def date_pairs(rng, count, first_year=2011, last_year=2023):
+    pairs = set()
+    while len(pairs) < count:
+        early = datetime.date(int(rng.integers(first_year, last_year + 1)), int(rng.integers(5, 10)), int(rng.integers(1, 28)))
+        later = early + datetime.timedelta(days=int(rng.integers(7, 40)))
+        pairs.add((early.strftime("%Y%m%d"), later.strftime("%Y%m%d")))
+    return sorted(pairs)
+
+
+def write_greenland(path):
+    # A rough ellipse stands in for the Natural Earth countries file
+    t = np.linspace(0, 2 * np.pi, 200)
+    greenland = shapely.Polygon(np.c_[-42 + 14 * np.cos(t), 72 + 10 * np.sin(t)])
+    with tempfile.TemporaryDirectory() as tmp:
+        gpd.GeoDataFrame({"NAME": ["Greenland"]}, geometry=[greenland], crs="EPSG:4326").to_file(
+            os.path.join(tmp, "countries.shp")
+        )
+        with zipfile.ZipFile(path, "w") as archive:
+            for name in os.listdir(tmp):
+                archive.write(os.path.join(tmp, name), name)
+
+
+def generate(root, sites=1, pairs=1, icebergs=100, vertices=40, seed=0):
+    """
+    Write a synthetic catalog below `root`, with `icebergs` icebergs per date pair.
+    Returns the path of its catalog-data folder.
+    """
+    rng = np.random.default_rng(seed)
+    data_dir = os.path.join(root, "catalog-data")
+    to_lonlat = Transformer.from_crs("EPSG:3413", "EPSG:4326", always_xy=True)
+
+    site_rows, pairing_rows = [], []
+    for s in range(sites):
+        site = SITE_IDS[s] if s < len(SITE_IDS) else f"S{s:02d}"
+        # Spread the sites along the coast, roughly between 60 and 80 degrees north
+        center = np.array([rng.uniform(-500_000, 500_000), rng.uniform(-3_000_000, -1_000_000)])
+        lon, lat = to_lonlat.transform(*center)
+        site_rows.append({
+            "Glacier_ID": site, "Official_n": f"Synthetic glacier {s}", "LAT": lat, "LON": lon,
+            "Region": REGIONS[s % len(REGIONS)],
+        })
+
+        for early, later in date_pairs(rng, pairs):
+            date_pair = f"{early}-{later}"
+            shapefile_dir = os.path.join(data_dir, "iceberg-shapefiles", site, date_pair)
+            os.makedirs(shapefile_dir, exist_ok=True)
+
+            outlines = iceberg_outlines(rng, icebergs, vertices, center)
+            for i, outline in enumerate(outlines):
+                date = early if i % 2 == 0 else later
+                gpd.GeoDataFrame({"id": [i]}, geometry=[outline], crs="EPSG:3413").to_file(
+                    os.path.join(shapefile_dir, f"{site}_{date}_{i:05d}.shp")
+                )
+
+            melt_dir = os.path.join(data_dir, "Melt-rates", site, date_pair)
+            os.makedirs(melt_dir, exist_ok=True)
+            centroids = shapely.get_coordinates(shapely.centroid(outlines))
+            melt = pd.DataFrame(rng.normal(size=(icebergs, len(MELT_COLUMNS))), columns=MELT_COLUMNS)
+            melt["X_i"], melt["Y_i"] = centroids[:, 0], centroids[:, 1]
+            melt["SurfaceArea"] = shapely.area(outlines)
+            melt["MeltRate"] = np.abs(melt["MeltRate"]) * 0.1
+            melt.to_csv(os.path.join(melt_dir, f"{site}_{date_pair}_iceberg_meltinfo.csv"), index=False)
+
+        pairing_rows.append({"Official_n": site_rows[-1]["Official_n"], "Corresponding icebergs": icebergs * pairs})
+
+    pd.DataFrame(site_rows).to_csv(os.path.join(data_dir, "Glacier-Locations.csv"), index=False)
+    pd.DataFrame(pairing_rows).to_csv(os.path.join(data_dir, "abbreviations-datepairings.csv"), index=False)
+    write_greenland(os.path.join(data_dir, "ne_110m_admin_0_countries.zip"))
+    return data_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic ICE-AGE catalog.")
+    parser.add_argument("root", help="Folder to write catalog-data/ into.")
+    parser.add_argument("--sites", type=int, default=1)
+    parser.add_argument("--date-pairs", type=int, default=1)
+    parser.add_argument("--icebergs", type=int, default=100, help="Icebergs per date pair.")
+    parser.add_argument("--vertices", type=int, default=40, help="Vertices per outline.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data_dir = generate(args.root, args.sites, args.date_pairs, args.icebergs, args.vertices, args.seed)
+    print(f"Wrote {args.sites * args.date_pairs * args.icebergs} icebergs to {data_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Headless batch rendering of every figure of the catalog.
+
+Renders, without Streamlit, the figures the pages show for every site and date pair
+(quartile comparison and per-iceberg grid pages), the study-site distribution and the
+correlogram of every melt-rate table, over a process pool. Figures go through the
+recipes of modules.figure_cache (matplotlib with the Agg backend), so anything already
+rendered for the pages is reused, and are written as files below the output folder:
+
+    <out>/distribution.png
+    <out>/<site>/<date pair>/quartiles.png
+    <out>/<site>/<date pair>/grid-01.png, grid-02.png, ...
+    <out>/correlograms/<site>/<date pair>.png
+
+<out>/manifest.json lists every output with its timing and a fingerprint of its inputs;
+on the next run, jobs whose inputs did not change and whose files are still there are
+skipped. From the repository root:
+
+    python -m modules.batch_figures --out figures --format png --workers 8
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .cache import atomic_path, file_fingerprint
+from .data_path import HISTO_CSV_FILE_PATH, MELT_RATES_DIR
+from .figure_cache import (
+    GRID_PAGE_SIZE,
+    PANEL_INCHES,
+    correlogram_figure,
+    distribution_figure,
+    figure_icebergs,
+    figure_quartiles,
+    icebergs_fingerprint,
+    iceberg_grid_figure,
+    quartile_figure,
+)
+from .geometry_store import load_geometry_store
+from .melt_store import scan_melt_rates
+
+# Override the pool size with ICE_AGE_FIGURE_WORKERS
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_OUTPUT_DIR = "figures"
+MANIFEST_NAME = "manifest.json"
+
+
+def write_output(path, data):
+    with atomic_path(path) as tmp_path, open(tmp_path, "wb") as f:
+        f.write(data)
+
+
+def render_date_pair(site, date_pair, out_dir, fmt):
+    """
+    Quartile figure and grid pages of one date pair. Returns their manifest entries.
+    """
+    icebergs = figure_icebergs(load_geometry_store(), site, date_pair)
+    quartiles = figure_quartiles(icebergs)
+    folder = os.path.join(out_dir, site, date_pair)
+
+    figures = []
+    start = time.perf_counter()
+    write_output(os.path.join(folder, f"quartiles.{fmt}"), quartile_figure(site, date_pair, icebergs, quartiles, fmt))
+    figures.append({"kind": "quartiles", "file": os.path.join(site, date_pair, f"quartiles.{fmt}"),
+                    "seconds": round(time.perf_counter() - start, 3)})
+
+    for page in range(-(-len(quartiles) // GRID_PAGE_SIZE)):
+        start = time.perf_counter()
+        name = f"grid-{page + 1:02d}.{fmt}"
+        write_output(os.path.join(folder, name), iceberg_grid_figure(site, date_pair, icebergs, quartiles, page, fmt=fmt))
+        figures.append({"kind": "iceberg_grid", "file": os.path.join(site, date_pair, name),
+                        "seconds": round(time.perf_counter() - start, 3)})
+    return figures
+
+
+def render_distribution(out_dir, fmt):
+    start = time.perf_counter()
+    write_output(os.path.join(out_dir, f"distribution.{fmt}"), distribution_figure(fmt))
+    return [{"kind": "distribution", "file": f"distribution.{fmt}", "seconds": round(time.perf_counter() - start, 3)}]
+
+
+def render_correlogram(site, date_pair, csv_path, out_dir, fmt):
+    start = time.perf_counter()
+    name = os.path.join("correlograms", site, f"{date_pair}.{fmt}")
+    write_output(os.path.join(out_dir, name), correlogram_figure(csv_path, fmt))
+    return [{"kind": "correlogram", "file": name, "seconds": round(time.perf_counter() - start, 3)}]
+
+
+def fingerprint(*parts):
+    return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+def plan_jobs(fmt):
+    """
+    {job id: (inputs fingerprint, render function, args)} for every figure of the catalog.
+    Only file stats and catalog attributes are read here.
+    """
+    jobs = {}
+    attributes = load_geometry_store().attributes
+    for (site, date_pair), rows in attributes.groupby(["site", "date_pair"], sort=True):
+        inputs = fingerprint(icebergs_fingerprint(rows), fmt, PANEL_INCHES, GRID_PAGE_SIZE)
+        jobs[f"{site}/{date_pair}"] = (inputs, render_date_pair, (site, date_pair))
+
+    if os.path.exists(HISTO_CSV_FILE_PATH):
+        jobs["distribution"] = (fingerprint(file_fingerprint(HISTO_CSV_FILE_PATH), fmt), render_distribution, ())
+
+    for table in scan_melt_rates(MELT_RATES_DIR).itertuples(index=False):
+        inputs = fingerprint(table.path, table.mtime, table.size, fmt)
+        jobs[f"correlogram/{table.site}/{table.date_pair}"] = (
+            inputs, render_correlogram, (table.site, table.date_pair, table.path),
+        )
+    return jobs
+
+
+def read_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"jobs": {}}
+
+
+def is_unchanged(entry, inputs, out_dir):
+    return (
+        entry is not None
+        and entry["inputs"] == inputs
+        and all(os.path.exists(os.path.join(out_dir, figure["file"])) for figure in entry["figures"])
+    )
+
+
+def run_job(render, args, out_dir, fmt):
+    # Runs in a pool process; errors are reported rather than aborting the batch
+    start = time.perf_counter()
+    try:
+        figures, error = render(*args, out_dir, fmt), None
+    except Exception as exc:
+        figures, error = [], f"{type(exc).__name__}: {exc}"
+    return figures, error, round(time.perf_counter() - start, 3)
+
+
+def render_all(out_dir=DEFAULT_OUTPUT_DIR, fmt="png", max_workers=None, force=False):
+    """
+    Render every figure whose inputs changed since the last run into out_dir and write the
+    manifest. Returns the manifest.
+    """
+    if max_workers is None:
+        max_workers = int(os.environ.get("ICE_AGE_FIGURE_WORKERS", DEFAULT_WORKERS))
+    start = time.perf_counter()
+    previous = read_manifest(out_dir)["jobs"]
+    jobs = plan_jobs(fmt)
+
+    manifest_jobs = {}
+    pending = {}
+    for job_id, (inputs, render, args) in jobs.items():
+        entry = previous.get(job_id)
+        if not force and is_unchanged(entry, inputs, out_dir):
+            manifest_jobs[job_id] = {**entry, "status": "unchanged"}
+        else:
+            pending[job_id] = (inputs, render, args)
+
+    def record(job_id, result):
+        figures, error, seconds = result
+        manifest_jobs[job_id] = {
+            "inputs": pending[job_id][0] if error is None else None,
+            "status": "rendered" if error is None else "failed",
+            "seconds": seconds,
+            "figures": figures,
+            **({"error": error} if error else {}),
+        }
+        print(f"{manifest_jobs[job_id]['status']:>8} {job_id} ({seconds:.1f} s)" + (f": {error}" if error else ""))
+
+    max_workers = max(1, min(max_workers, len(pending)))
+    if max_workers == 1:
+        for job_id, (_, render, args) in pending.items():
+            record(job_id, run_job(render, args, out_dir, fmt))
+    else:
+        with ProcessPoolExecutor(max_workers) as pool:
+            futures = {
+                pool.submit(run_job, render, args, out_dir, fmt): job_id
+                for job_id, (_, render, args) in pending.items()
+            }
+            for future in as_completed(futures):
+                record(futures[future], future.result())
+
+    statuses = [entry["status"] for entry in manifest_jobs.values()]
+    manifest = {
+        "generated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "format": fmt,
+        "workers": max_workers,
+        "seconds": round(time.perf_counter() - start, 3),
+        "summary": {status: statuses.count(status) for status in ("rendered", "unchanged", "failed")},
+        "jobs": dict(sorted(manifest_jobs.items())),
+    }
+    write_output(os.path.join(out_dir, MANIFEST_NAME), json.dumps(manifest, indent=2).encode())
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render every figure of the catalog to files.")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT_DIR, help="Output folder.")
+    parser.add_argument("--format", default="png", choices=["png", "svg"])
+    parser.add_argument("--workers", type=int, help="Size of the process pool (default: number of cores).")
+    parser.add_argument("--force", action="store_true", help="Render every figure, even unchanged ones.")
+    args = parser.parse_args()
+
+    manifest = render_all(args.out, args.format, args.workers, args.force)
+    summary = manifest["summary"]
+    print(
+        f"{summary['rendered']} jobs rendered, {summary['unchanged']} unchanged, {summary['failed']} failed "
+        f"in {manifest['seconds']:.1f} s; manifest in {os.path.join(args.out, MANIFEST_NAME)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
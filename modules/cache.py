@@ -0,0 +1,185 @@
+"""
+Process-wide cache for data loaded from files.
+
+Streamlit runs every session in the same process, so one cache here is shared by all
+users. Entries are keyed on the loader, its arguments and the fingerprint (mtime and
+size) of the file it reads: editing or replacing the file invalidates the entry on the
+next call. The cache is an LRU bounded by an estimate of the memory the cached objects
+hold, and it keeps hit/miss/eviction counters per loader.
+
+Cached objects are shared between callers, treat them as read-only (copy before
+modifying in place).
+"""
+import functools
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from .instrumentation import span
+
+# Memory budget for all cached objects, override with ICE_AGE_CACHE_MB
+DEFAULT_CACHE_MB = 512
+
+
+def file_fingerprint(path):
+    """
+    (path, mtime, size) of a file, with None for both when it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path, None, None
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    Yield a temporary path next to `path` to write to; it is moved onto `path` when the
+    block succeeds and removed when it fails. The name is unique (tempfile.mkstemp), so
+    sessions, threads and processes writing the same file never share a temporary file,
+    and readers never see a half-written one.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def estimate_size(obj):
+    """
+    Rough number of bytes held by a loaded object. Geometry columns are counted by their
+    coordinates, since pandas only sees the Python wrappers of shapely objects.
+    """
+    if isinstance(obj, pd.DataFrame):
+        size = 0
+        for column in obj.columns:
+            values = obj[column]
+            if values.dtype == "geometry":
+                import shapely
+
+                size += 16 * int(shapely.get_num_coordinates(values.to_numpy()).sum()) + 100 * len(values)
+            else:
+                size += int(values.memory_usage(deep=True, index=False))
+        return size + int(obj.index.memory_usage(deep=True))
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (bytes, str)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_size(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(estimate_size(value) for value in obj)
+    return sys.getsizeof(obj)
+
+
+class FileCache:
+    """
+    LRU cache of loaded files bounded by `max_bytes`.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.total_bytes = 0
+        self.counters = {}
+        self.lock = threading.RLock()
+
+    def _count(self, name, counter):
+        counts = self.counters.setdefault(name, {"hits": 0, "misses": 0, "evictions": 0})
+        counts[counter] += 1
+
+    def load(self, loader, path, *args, **kwargs):
+        """
+        Return loader(path, *args, **kwargs), reusing the cached result while the file at
+        `path` is unchanged.
+        """
+        name = f"{loader.__module__}.{loader.__qualname__}"
+        fingerprint = file_fingerprint(path)
+        key = (name, fingerprint, args, tuple(sorted(kwargs.items())))
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self._count(name, "hits")
+                return self.entries[key][0]
+            self._count(name, "misses")
+
+        # Load outside the lock so a slow file does not block other loaders
+        with span(f"load.{loader.__name__}"):
+            value = loader(path, *args, **kwargs)
+        size = estimate_size(value)
+
+        with self.lock:
+            # Drop results of the same loader for older versions of the file
+            for stale in [k for k in self.entries if k[0] == name and k[1][0] == path and k[1] != fingerprint]:
+                self._remove(stale)
+            if key not in self.entries and size <= self.max_bytes:
+                self.entries[key] = (value, size)
+                self.total_bytes += size
+                while self.total_bytes > self.max_bytes:
+                    evicted = next(iter(self.entries))
+                    self._remove(evicted)
+                    self._count(evicted[0], "evictions")
+        return value
+
+    def _remove(self, key):
+        _, size = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def invalidate(self, path=None):
+        """
+        Drop every entry read from `path`, or all entries when no path is given.
+        """
+        with self.lock:
+            for key in [k for k in self.entries if path is None or k[1][0] == path]:
+                self._remove(key)
+
+    def stats(self):
+        """
+        Counters per loader, plus the number of entries and bytes currently held.
+        """
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "loaders": {name: dict(counts) for name, counts in self.counters.items()},
+            }
+
+
+file_cache = FileCache(int(os.environ.get("ICE_AGE_CACHE_MB", DEFAULT_CACHE_MB)) * 1024 * 1024)
+
+
+def cached_file_loader(loader):
+    """
+    Decorator for loaders whose first argument is the path of the file they read.
+    """
+    @functools.wraps(loader)
+    def wrapper(path, *args, **kwargs):
+        return file_cache.load(loader, path, *args, **kwargs)
+
+    wrapper.uncached = loader
+    return wrapper
+
+
+def cache_stats():
+    return file_cache.stats()
+
+
+def invalidate(path=None):
+    file_cache.invalidate(path)
@@ -0,0 +1,267 @@
+"""
+Persistent iceberg catalog index.
+
+Instead of walking SHAPEFILE_CATALOG_DIR and opening every .shp on each page rerun,
+the catalog is ingested once into a single GeoParquet file with one row per iceberg
+(site, date pair and shapefile name), holding the outline in EPSG:3413 and EPSG:4326
+together with precomputed area, bounds and centroid.
+
+Build or refresh the index from the repository root with:
+
+    python -m modules.catalog            # incremental: only re-reads changed shapefiles
+    python -m modules.catalog --full     # rebuild everything from scratch
+"""
+import argparse
+import os
+
+import geopandas as gpd
+import pandas as pd
+
+from .cache import atomic_path, file_cache
+from .data_path import CATALOG_INDEX_PATH, SHAPEFILE_CATALOG_DIR
+from .instrumentation import span, timed
+from .metrics import geometry_metrics
+from .simplify import SIMPLIFIED_COLUMNS, add_simplified_columns
+
+CATALOG_CRS = "EPSG:3413"  # Proper projection for Greenland, all metrics are in meters
+DISPLAY_CRS = "EPSG:4326"
+
+KEY_COLUMNS = ["site", "date_pair", "shapefile"]
+FILE_COLUMNS = KEY_COLUMNS + ["early_date", "later_date", "path", "mtime", "size"]
+SHAPE_COLUMNS = [
+    "perimeter", "minx", "miny", "maxx", "maxy", "width", "height",
+    "long_axis", "short_axis", "aspect_ratio", "dominant_angle",
+]
+
+
+@timed("catalog.scan")
+def scan_catalog(catalog_dir=SHAPEFILE_CATALOG_DIR):
+    """
+    Walk <catalog_dir>/<site>/<early>-<later>/*.shp and return one row per shapefile.
+    The mtime/size columns cover the .shp and all of its sidecar files, so editing
+    a .dbf or .prj also marks the iceberg as changed.
+    """
+    rows = []
+    if not os.path.exists(catalog_dir):
+        return pd.DataFrame(columns=FILE_COLUMNS)
+
+    for site in sorted(os.scandir(catalog_dir), key=lambda entry: entry.name):
+        if not site.is_dir():
+            continue
+        for date_pair in sorted(os.scandir(site.path), key=lambda entry: entry.name):
+            if not date_pair.is_dir() or '-' not in date_pair.name:
+                continue
+            early_date, later_date = date_pair.name.split('-')[:2]
+
+            # Group every file in the folder by stem, so sidecars are stat'ed only once
+            stats = {}
+            for entry in os.scandir(date_pair.path):
+                stem = os.path.splitext(entry.name)[0]
+                stat = entry.stat()
+                mtime, size = stats.get(stem, (0, 0))
+                stats[stem] = (max(mtime, stat.st_mtime_ns), size + stat.st_size)
+
+            for shapefile in sorted(f for f in os.listdir(date_pair.path) if f.endswith(".shp")):
+                mtime, size = stats[os.path.splitext(shapefile)[0]]
+                rows.append({
+                    "site": site.name,
+                    "date_pair": date_pair.name,
+                    "shapefile": shapefile,
+                    "early_date": early_date,
+                    "later_date": later_date,
+                    "path": os.path.join(date_pair.path, shapefile),
+                    "mtime": mtime,
+                    "size": size,
+                })
+
+    return pd.DataFrame(rows, columns=FILE_COLUMNS)
+
+
+def read_iceberg(shapefile_path):
+    """
+    Read one iceberg shapefile in EPSG:3413. Returns (geometry, area), or None for an
+    empty shapefile. Shapefiles with several features are merged into one outline.
+    """
+    with span("shapefile.read_file"):
+        gdf = gpd.read_file(shapefile_path)
+    if gdf.empty:
+        return None
+
+    if gdf.crs is None:
+        gdf = gdf.set_crs(CATALOG_CRS)
+    with span("shapefile.to_crs"):
+        gdf = gdf.to_crs(CATALOG_CRS)
+
+    geometry = gdf.geometry.iloc[0] if len(gdf) == 1 else gdf.geometry.union_all()
+    return geometry, gdf.area.sum()
+
+
+@timed("catalog.derive")
+def add_derived_columns(icebergs):
+    """
+    Add bounds, shape metrics, centroid, simplified outlines and the EPSG:4326 outline
+    for every row, computed for the whole frame at once rather than one shapefile at a time.
+    """
+    metrics = geometry_metrics(icebergs.geometry)
+    for column in SHAPE_COLUMNS:
+        icebergs[column] = metrics[column]
+
+    centroids = icebergs.geometry.centroid
+    icebergs["centroid_x"] = centroids.x
+    icebergs["centroid_y"] = centroids.y
+    centroids = centroids.to_crs(DISPLAY_CRS)
+    icebergs["centroid_lon"] = centroids.x
+    icebergs["centroid_lat"] = centroids.y
+
+    icebergs = add_simplified_columns(icebergs)
+    icebergs["geometry_4326"] = icebergs.geometry.to_crs(DISPLAY_CRS)
+    return icebergs
+
+
+@timed("catalog.ingest")
+def ingest(files, max_workers=None, executor="thread"):
+    """
+    Read the shapefiles listed in `files` (rows of scan_catalog) into catalog rows, in
+    parallel (see modules.parallel). Returns the rows and the LoadResults of the files
+    that failed to load, which are left out of the catalog.
+    """
+    from .parallel import load_shapefiles
+
+    results = load_shapefiles(files["path"], max_workers=max_workers, executor=executor)
+
+    rows, geometries, failed = [], [], []
+    for row, result in zip(files.itertuples(index=False), results):
+        if result.error is not None:
+            failed.append(result)
+            continue
+        if result.geometry is None:
+            continue
+        rows.append(row._asdict())
+        rows[-1]["area"] = result.area
+        geometries.append(result.geometry)
+
+    icebergs = gpd.GeoDataFrame(
+        pd.DataFrame(rows, columns=FILE_COLUMNS + ["area"]),
+        geometry=gpd.GeoSeries(geometries, crs=CATALOG_CRS),
+    )
+    return add_derived_columns(icebergs), failed
+
+
+def build_catalog(catalog_dir=SHAPEFILE_CATALOG_DIR, index_path=CATALOG_INDEX_PATH, full=False,
+                  max_workers=None, executor="thread"):
+    """
+    Build the catalog index, or refresh it incrementally when one already exists:
+    unchanged shapefiles (same mtime and size) are kept as they are, changed and new
+    ones are re-ingested and deleted ones are dropped. Shapefiles that fail to load are
+    skipped (and retried on the next refresh).
+
+    Returns the catalog and a dict with the number of kept, ingested and removed rows
+    and the LoadResults of failed files.
+    """
+    files = scan_catalog(catalog_dir)
+
+    existing = None
+    if not full and os.path.exists(index_path):
+        existing = read_catalog(index_path)
+        # An index written before new columns were added is rebuilt from scratch
+        if not set(SHAPE_COLUMNS + SIMPLIFIED_COLUMNS).issubset(existing.columns):
+            existing = None
+
+    if existing is None or existing.empty:
+        kept = None
+        stale = files
+        removed = 0
+    else:
+        merged = files.merge(
+            existing[KEY_COLUMNS + ["mtime", "size"]],
+            on=KEY_COLUMNS, how="left", suffixes=("", "_indexed"),
+        )
+        unchanged = (merged["mtime"] == merged["mtime_indexed"]) & (merged["size"] == merged["size_indexed"])
+        kept = existing.merge(files.loc[unchanged.to_numpy(), KEY_COLUMNS], on=KEY_COLUMNS)
+        stale = files.loc[~unchanged.to_numpy()]
+        removed = len(existing) - len(existing[KEY_COLUMNS].merge(files[KEY_COLUMNS], on=KEY_COLUMNS))
+
+    ingested, failed = ingest(stale, max_workers=max_workers, executor=executor)
+    if kept is not None and not ingested.empty:
+        catalog = pd.concat([kept, ingested], ignore_index=True)
+    else:
+        catalog = ingested if kept is None else kept
+    catalog = catalog.sort_values(KEY_COLUMNS).reset_index(drop=True)
+
+    write_catalog(catalog, index_path)
+    summary = {
+        "kept": 0 if kept is None else len(kept),
+        "ingested": len(ingested),
+        "removed": removed,
+        "failed": failed,
+    }
+    return catalog, summary
+
+
+def write_catalog(catalog, index_path=CATALOG_INDEX_PATH):
+    # Write next to the target and swap it in, so readers never see a half-written file
+    with atomic_path(index_path) as tmp_path:
+        catalog.to_parquet(tmp_path, index=False)
+
+
+@timed("catalog.read_index")
+def read_catalog(index_path=CATALOG_INDEX_PATH):
+    return gpd.read_parquet(index_path)
+
+
+def catalog_fingerprint(index_path=CATALOG_INDEX_PATH):
+    """
+    (mtime, size) of the index file; changes whenever the catalog is rebuilt or refreshed.
+    """
+    stat = os.stat(index_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_catalog(index_path=CATALOG_INDEX_PATH):
+    """
+    Return the catalog index, building it first if it does not exist yet.
+    The parsed index is cached and reused until the file on disk changes.
+    """
+    if not os.path.exists(index_path):
+        build_catalog(index_path=index_path)
+    return file_cache.load(read_catalog, index_path)
+
+
+def catalog_sites(catalog):
+    return sorted(catalog["site"].unique())
+
+
+def catalog_date_pairs(catalog, site):
+    return sorted(catalog.loc[catalog["site"] == site, "date_pair"].unique())
+
+
+def catalog_icebergs(catalog, site, date_pair):
+    """
+    All icebergs of one site and date pair, in shapefile name order.
+    """
+    icebergs = catalog[(catalog["site"] == site) & (catalog["date_pair"] == date_pair)]
+    return icebergs.reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or refresh the iceberg catalog index.")
+    parser.add_argument("--catalog-dir", default=SHAPEFILE_CATALOG_DIR)
+    parser.add_argument("--index", default=CATALOG_INDEX_PATH)
+    parser.add_argument("--full", action="store_true", help="Re-ingest every shapefile.")
+    parser.add_argument("--workers", type=int, help="Size of the loading pool (default: number of cores).")
+    parser.add_argument("--executor", default="thread", choices=["thread", "process"])
+    args = parser.parse_args()
+
+    catalog, summary = build_catalog(
+        args.catalog_dir, args.index, full=args.full, max_workers=args.workers, executor=args.executor,
+    )
+    print(
+        f"{len(catalog)} icebergs in {args.index} "
+        f"({summary['ingested']} ingested, {summary['kept']} unchanged, {summary['removed']} removed)"
+    )
+    for result in summary["failed"]:
+        print(f"Failed to load {result.path}: {result.error}")
+
+
+if __name__ == "__main__":
+    main()
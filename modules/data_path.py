@@ -6,4 +6,30 @@ GLACIER_LOCATIONS_CSV = "catalog-data/Glacier-Locations.csv"
 
 HISTO_CSV_FILE_PATH = "catalog-data/abbreviations-datepairings.csv"
 NATURAL_EARTH_PATH = "catalog-data/ne_110m_admin_0_countries.zip"
+# Greenland outline of the Home map, derived from the Natural Earth file above
+GREENLAND_GEOJSON_PATH = "catalog-data/greenland.geojson"
 SHAPEFILE_CATALOG_DIR = "catalog-data/iceberg-shapefiles"
+
+# Built by `python -m modules.catalog` from the shapefiles above
+CATALOG_INDEX_PATH = "catalog-data/iceberg-catalog.parquet"
+
+# Vector tiles of the catalog, written by `python -m modules.tiles --seed`
+TILE_CACHE_DIR = "catalog-data/tiles"
+
+# Melt-rate tables: <site>/<early>-<later>/<site>_<early>-<later>_iceberg_meltinfo.csv
+MELT_RATES_DIR = "catalog-data/Melt-rates"
+
+# Rendered figures, see modules.figure_cache
+FIGURE_CACHE_DIR = "catalog-data/figure-cache"
+
+# Per-rerun timings, appended as JSON lines when ICE_AGE_PROFILE=1 (modules.instrumentation)
+INSTRUMENTATION_LOG_PATH = "catalog-data/logs/render-timings.jsonl"
+
+# Every melt-rate table in one file, built by `python -m modules.melt_store`
+MELT_STORE_PATH = "catalog-data/melt-rates.parquet"
+
+# Outlines of the catalog as memory-mapped arrays, built by `python -m modules.geometry_store`
+GEOMETRY_STORE_DIR = "catalog-data/geometry-store"
+
+# Bulk exports of icebergs (modules.export), served by the tile server
+EXPORT_DIR = "catalog-data/exports"
@@ -0,0 +1,212 @@
+"""
+Iceberg density rasters for region-wide views.
+
+Instead of drawing thousands of outlines, the icebergs of a region (or of the whole
+catalog) are binned by centroid onto a regular EPSG:3413 grid with one np.bincount per
+statistic:
+
+    count      icebergs per cell            (catalog centroids)
+    area       total outline area per cell  (catalog, m²)
+    melt_rate  mean MeltRate per cell       (melt-rate store, X_i/Y_i)
+
+Grids are aligned on multiples of the resolution and cached per resolution and filter
+until the catalog (or melt store) changes. Drawing them, as a matplotlib image or as a
+folium image overlay reprojected to Web Mercator, costs in proportion to the number of
+pixels, whatever the number of icebergs.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from .cache import cached_file_loader
+from .catalog import CATALOG_CRS, load_catalog
+from .data_path import CATALOG_INDEX_PATH, GLACIER_LOCATIONS_CSV, MELT_STORE_PATH
+from .instrumentation import timed
+from .loaders import load_glacier_sites
+from .melt_store import add_group_columns, load_melt_store
+
+DENSITY_STATISTICS = {"count": "Icebergs per cell", "area": "Iceberg area per cell (m²)", "melt_rate": "Mean melt rate"}
+DENSITY_RESOLUTIONS = [250, 500, 1000, 2500, 5000]  # meters in EPSG:3413
+# Melt-rate tables without iceberg positions (or an empty store) give no melt_rate density
+MELT_DENSITY_COLUMNS = ["X_i", "Y_i", "MeltRate"]
+
+# Grids are coarsened until they fit, so a fine resolution over a wide area stays bounded
+MAX_DENSITY_PIXELS = 4_000_000
+
+
+def grid_shape(bounds, resolution):
+    minx, miny, maxx, maxy = bounds
+    return int(round((maxy - miny) / resolution)), int(round((maxx - minx) / resolution))
+
+
+def grid_bounds(x, y, resolution):
+    """
+    Bounds of the grid covering every point, aligned on multiples of the resolution.
+    """
+    minx, miny = np.floor(x.min() / resolution) * resolution, np.floor(y.min() / resolution) * resolution
+    maxx, maxy = (np.floor(x.max() / resolution) + 1) * resolution, (np.floor(y.max() / resolution) + 1) * resolution
+    return float(minx), float(miny), float(maxx), float(maxy)
+
+
+def fitting_resolution(x, y, resolution, max_pixels=MAX_DENSITY_PIXELS):
+    # Double the cell size until the grid holds at most max_pixels
+    while np.prod(grid_shape(grid_bounds(x, y, resolution), resolution)) > max_pixels:
+        resolution *= 2
+    return resolution
+
+
+def rasterize(x, y, values, statistic, resolution):
+    """
+    Bin points onto an EPSG:3413 grid. Returns a dict with `values` (rows from north to
+    south, NaN where no iceberg falls), `bounds`, `resolution`, `statistic` and `points`.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    valid = np.isfinite(x) & np.isfinite(y)
+    if values is not None:
+        values = np.asarray(values, dtype=float)
+        valid &= np.isfinite(values)
+        values = values[valid]
+    x, y = x[valid], y[valid]
+    if len(x) == 0:
+        return None
+
+    resolution = fitting_resolution(x, y, resolution)
+    bounds = grid_bounds(x, y, resolution)
+    num_rows, num_columns = grid_shape(bounds, resolution)
+    columns = np.clip(((x - bounds[0]) // resolution).astype(np.int64), 0, num_columns - 1)
+    rows = np.clip(((bounds[3] - y) // resolution).astype(np.int64), 0, num_rows - 1)
+    cells = rows * num_columns + columns
+
+    counts = np.bincount(cells, minlength=num_rows * num_columns).astype(float)
+    if statistic == "count":
+        grid = counts
+    else:
+        sums = np.bincount(cells, weights=values, minlength=num_rows * num_columns)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            grid = sums if statistic == "area" else sums / counts
+    grid[counts == 0] = np.nan
+
+    return {
+        "values": grid.reshape(num_rows, num_columns),
+        "bounds": bounds,
+        "resolution": resolution,
+        "statistic": statistic,
+        "points": int(len(x)),
+    }
+
+
+def filter_rows(frame, region=None, year=None, site=None):
+    """
+    Rows of a frame with site and early_date columns, restricted by region, year and site.
+    """
+    if os.path.exists(GLACIER_LOCATIONS_CSV):
+        glacier_sites = load_glacier_sites()
+    else:
+        glacier_sites = pd.DataFrame(columns=["Glacier_ID", "Region"])
+    groups = add_group_columns(frame[["site", "early_date"]].copy(), glacier_sites)
+    mask = np.ones(len(frame), dtype=bool)
+    for column, value in (("region", region), ("year", year), ("site", site)):
+        if value is not None:
+            mask &= (groups[column] == value).fillna(False).to_numpy()
+    return frame[mask]
+
+
+@cached_file_loader
+@timed("density.catalog")
+def read_catalog_density(index_path, statistic, resolution, region, year, site):
+    icebergs = filter_rows(load_catalog(index_path), region, year, site)
+    values = icebergs["area"] if statistic == "area" else None
+    return rasterize(icebergs["centroid_x"], icebergs["centroid_y"], values, statistic, resolution)
+
+
+@cached_file_loader
+@timed("density.melt")
+def read_melt_density(store_path, resolution, region, year, site):
+    store = load_melt_store(store_path)
+    if not set(MELT_DENSITY_COLUMNS) <= set(store.columns):
+        return None
+    rows = filter_rows(store, region, year, site)
+    return rasterize(rows["X_i"], rows["Y_i"], rows["MeltRate"], "melt_rate", resolution)
+
+
+def density_statistics(melt_store=None):
+    """
+    The DENSITY_STATISTICS that can be drawn: melt_rate only when the melt store has
+    MELT_DENSITY_COLUMNS.
+    """
+    if melt_store is None:
+        melt_store = load_melt_store(MELT_STORE_PATH)
+    has_melt = set(MELT_DENSITY_COLUMNS) <= set(melt_store.columns)
+    return {key: label for key, label in DENSITY_STATISTICS.items() if key != "melt_rate" or has_melt}
+
+
+def density_grid(statistic="count", resolution=1000, region=None, year=None, site=None):
+    """
+    Cached density raster of one of DENSITY_STATISTICS, or None when no iceberg matches.
+    """
+    if statistic == "melt_rate":
+        load_melt_store(MELT_STORE_PATH)
+        return read_melt_density(MELT_STORE_PATH, resolution, region, year, site)
+    load_catalog(CATALOG_INDEX_PATH)
+    return read_catalog_density(CATALOG_INDEX_PATH, statistic, resolution, region, year, site)
+
+
+def colorize(values, cmap="viridis", log=False):
+    """
+    RGBA uint8 image of a raster, transparent where it is NaN.
+    """
+    import matplotlib
+    from matplotlib.colors import LogNorm, Normalize
+
+    finite = values[np.isfinite(values)]
+    if log and len(finite) and finite.min() > 0:
+        norm = LogNorm(finite.min(), max(finite.max(), finite.min() * 10))
+    else:
+        norm = Normalize(*(finite.min(), finite.max()) if len(finite) else (0, 1))
+    image = matplotlib.colormaps[cmap](norm(np.where(np.isfinite(values), values, np.nan)), bytes=True)
+    image[~np.isfinite(values)] = 0
+    return image
+
+
+@timed("density.web_mercator")
+def to_web_mercator(density, max_size=1024):
+    """
+    Resample a raster to a Web Mercator grid (nearest cell) for a folium ImageOverlay.
+    Returns (values, [[south, west], [north, east]]). Each output pixel is projected
+    back once, so the cost follows the pixel count.
+    """
+    from pyproj import Transformer
+
+    to_mercator = Transformer.from_crs(CATALOG_CRS, "EPSG:3857", always_xy=True)
+    to_polar = Transformer.from_crs("EPSG:3857", CATALOG_CRS, always_xy=True)
+    to_lonlat = Transformer.from_crs("EPSG:3857", "EPSG:4326", always_xy=True)
+
+    minx, miny, maxx, maxy = density["bounds"]
+    edge_x = np.r_[np.linspace(minx, maxx, 33), np.full(33, maxx), np.linspace(maxx, minx, 33), np.full(33, minx)]
+    edge_y = np.r_[np.full(33, miny), np.linspace(miny, maxy, 33), np.full(33, maxy), np.linspace(maxy, miny, 33)]
+    mx, my = to_mercator.transform(edge_x, edge_y)
+    west, east, south, north = min(mx), max(mx), min(my), max(my)
+
+    # As many pixels along the longer side as the raster has cells, keeping the Mercator aspect
+    num_rows, num_columns = density["values"].shape
+    size = min(max_size, max(num_rows, num_columns))
+    if (east - west) > (north - south):
+        width, height = size, max(1, round(size * (north - south) / (east - west)))
+    else:
+        width, height = max(1, round(size * (east - west) / (north - south))), size
+
+    px = west + (np.arange(width) + 0.5) * (east - west) / width
+    py = north - (np.arange(height) + 0.5) * (north - south) / height
+    grid_x, grid_y = np.meshgrid(px, py)
+    x, y = to_polar.transform(grid_x.ravel(), grid_y.ravel())
+
+    resolution = density["resolution"]
+    columns = np.floor((np.asarray(x) - minx) / resolution).astype(np.int64)
+    rows = np.floor((maxy - np.asarray(y)) / resolution).astype(np.int64)
+    inside = (columns >= 0) & (columns < num_columns) & (rows >= 0) & (rows < num_rows)
+    values = np.full(len(columns), np.nan)
+    values[inside] = density["values"][rows[inside], columns[inside]]
+
+    (lon_west, lon_east), (lat_south, lat_north) = to_lonlat.transform([west, east], [south, north])
+    return values.reshape(height, width), [[lat_south, lon_west], [lat_north, lon_east]]
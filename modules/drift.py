@@ -0,0 +1,179 @@
+"""
+Iceberg drift tracking between the two dates of a date pair.
+
+Early-date icebergs are paired with later-date ones by minimising, over the whole date
+pair at once, a cost made of:
+
+    centroid distance / max_distance
+    + AREA_WEIGHT  * |log(later area / early area)|
+    + SHAPE_WEIGHT * |log(later aspect ratio / early aspect ratio)|
+
+Only pairs closer than max_distance are candidates (found with a KD-tree on the
+centroids), so the cost matrix is sparse. Each connected group of candidates is solved
+on its own with the Hungarian algorithm (scipy linear_sum_assignment), which keeps the
+matching of thousands of icebergs to small dense problems. Icebergs without a candidate
+stay unmatched.
+
+Everything is computed from catalog columns (EPSG:3413 centroids, area, aspect ratio and
+the dominant angle of calculate_dominant_angle), and results are cached per date pair
+until the catalog changes.
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from .cache import cached_file_loader
+from .catalog import catalog_icebergs, load_catalog
+from .data_path import CATALOG_INDEX_PATH
+from .instrumentation import timed
+
+# Farthest an iceberg is assumed to drift between the two dates, in meters
+DEFAULT_MAX_DISTANCE = 5000.0
+
+AREA_WEIGHT = 1.0
+SHAPE_WEIGHT = 0.5
+
+DRIFT_COLUMNS = [
+    "early_shapefile", "later_shapefile", "dx", "dy", "distance", "bearing", "speed",
+    "rotation", "area_change", "area_ratio", "cost",
+    "early_lon", "early_lat", "later_lon", "later_lat",
+]
+
+
+def split_dates(icebergs, early_date, later_date):
+    """
+    Early-date and later-date rows of one date pair, by the date in their shapefile name.
+    """
+    names = icebergs["shapefile"]
+    early = icebergs[names.str.contains(early_date, regex=False).to_numpy()]
+    later = icebergs[names.str.contains(later_date, regex=False).to_numpy()]
+    return early.reset_index(drop=True), later.reset_index(drop=True)
+
+
+def candidate_costs(early, later, max_distance=DEFAULT_MAX_DISTANCE):
+    """
+    (early rows, later rows, costs) of every pair closer than max_distance.
+    """
+    from scipy.spatial import cKDTree
+
+    early_xy = early[["centroid_x", "centroid_y"]].to_numpy()
+    later_xy = later[["centroid_x", "centroid_y"]].to_numpy()
+    pairs = cKDTree(early_xy).sparse_distance_matrix(cKDTree(later_xy), max_distance, output_type="ndarray")
+    rows, cols, distances = pairs["i"], pairs["j"], pairs["v"]
+
+    area_ratio = later["area"].to_numpy()[cols] / early["area"].to_numpy()[rows]
+    aspect_ratio = later["aspect_ratio"].to_numpy()[cols] / early["aspect_ratio"].to_numpy()[rows]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        costs = (
+            distances / max_distance
+            + AREA_WEIGHT * np.abs(np.log(area_ratio))
+            + SHAPE_WEIGHT * np.abs(np.log(aspect_ratio))
+        )
+    costs = np.nan_to_num(costs, nan=np.inf, posinf=np.inf)
+    finite = np.isfinite(costs)
+    return rows[finite], cols[finite], costs[finite]
+
+
+def assign(rows, cols, costs, num_early, num_later):
+    """
+    Minimum-cost one-to-one matching of a sparse cost matrix, solved per connected
+    component. Returns matched (early rows, later rows, costs).
+    """
+    from scipy.optimize import linear_sum_assignment
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    if len(costs) == 0:
+        return np.array([], dtype=int), np.array([], dtype=int), np.array([])
+
+    # Early icebergs are nodes 0..num_early-1, later ones num_early..
+    graph = coo_matrix(
+        (np.ones(len(rows)), (rows, cols + num_early)), shape=(num_early + num_later,) * 2,
+    )
+    _, labels = connected_components(graph, directed=False)
+    component = labels[rows]
+
+    matched_early, matched_later, matched_costs = [], [], []
+    order = np.argsort(component, kind="stable")
+    starts = np.flatnonzero(np.r_[True, np.diff(component[order]) != 0])
+    for group in np.split(order, starts[1:]):
+        early_ids, early_local = np.unique(rows[group], return_inverse=True)
+        later_ids, later_local = np.unique(cols[group], return_inverse=True)
+        if len(group) == 1:
+            matched_early.append(early_ids)
+            matched_later.append(later_ids)
+            matched_costs.append(costs[group])
+            continue
+
+        # Pairs that are not candidates get a cost no candidate matching can reach
+        dense = np.full((len(early_ids), len(later_ids)), costs[group].sum() + 1.0)
+        dense[early_local, later_local] = costs[group]
+        is_candidate = np.zeros(dense.shape, dtype=bool)
+        is_candidate[early_local, later_local] = True
+
+        r, c = linear_sum_assignment(dense)
+        keep = is_candidate[r, c]
+        matched_early.append(early_ids[r[keep]])
+        matched_later.append(later_ids[c[keep]])
+        matched_costs.append(dense[r[keep], c[keep]])
+
+    return np.concatenate(matched_early), np.concatenate(matched_later), np.concatenate(matched_costs)
+
+
+def wrap_rotation(degrees):
+    # Outline orientations repeat every 180 degrees
+    return (np.asarray(degrees) + 90) % 180 - 90
+
+
+@timed("drift.match")
+def match_icebergs(icebergs, early_date, later_date, max_distance=DEFAULT_MAX_DISTANCE):
+    """
+    Pair the early-date and later-date icebergs of one date pair (catalog rows) and
+    return one row per pair with the drift vector (dx, dy, distance in meters, bearing in
+    degrees clockwise from grid north, speed in meters per day), the rotation of the
+    dominant angle in degrees and the area change in square meters.
+    """
+    early, later = split_dates(icebergs, early_date, later_date)
+    rows, cols, costs = candidate_costs(early, later, max_distance)
+    e, l, matched_costs = assign(rows, cols, costs, len(early), len(later))
+
+    dx = later["centroid_x"].to_numpy()[l] - early["centroid_x"].to_numpy()[e]
+    dy = later["centroid_y"].to_numpy()[l] - early["centroid_y"].to_numpy()[e]
+    distance = np.hypot(dx, dy)
+    days = (datetime.datetime.strptime(later_date, "%Y%m%d") - datetime.datetime.strptime(early_date, "%Y%m%d")).days
+    early_area, later_area = early["area"].to_numpy()[e], later["area"].to_numpy()[l]
+
+    drift = pd.DataFrame({
+        "early_shapefile": early["shapefile"].to_numpy()[e],
+        "later_shapefile": later["shapefile"].to_numpy()[l],
+        "dx": dx,
+        "dy": dy,
+        "distance": distance,
+        "bearing": np.degrees(np.arctan2(dx, dy)) % 360,
+        "speed": distance / days if days > 0 else np.nan,
+        "rotation": wrap_rotation(later["dominant_angle"].to_numpy()[l] - early["dominant_angle"].to_numpy()[e]),
+        "area_change": later_area - early_area,
+        "area_ratio": later_area / early_area,
+        "cost": matched_costs,
+        "early_lon": early["centroid_lon"].to_numpy()[e],
+        "early_lat": early["centroid_lat"].to_numpy()[e],
+        "later_lon": later["centroid_lon"].to_numpy()[l],
+        "later_lat": later["centroid_lat"].to_numpy()[l],
+    }, columns=DRIFT_COLUMNS)
+    return drift.sort_values("early_shapefile").reset_index(drop=True)
+
+
+@cached_file_loader
+def read_drift(index_path, site, date_pair, max_distance):
+    early_date, later_date = date_pair.split("-")
+    icebergs = catalog_icebergs(load_catalog(index_path), site, date_pair)
+    return match_icebergs(icebergs, early_date, later_date, max_distance)
+
+
+def load_drift(site, date_pair, max_distance=DEFAULT_MAX_DISTANCE, index_path=CATALOG_INDEX_PATH):
+    """
+    match_icebergs for one date pair of the catalog, cached until the catalog changes.
+    """
+    load_catalog(index_path)  # Builds the catalog if it does not exist yet
+    return read_drift(index_path, site, date_pair, float(max_distance))
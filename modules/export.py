@@ -0,0 +1,195 @@
+"""
+Bulk export of iceberg outlines and metrics.
+
+All icebergs of a date pair, a site, a region or the whole catalog are written as
+GeoParquet, GeoPackage or a zipped shapefile, with their full EPSG:3413 outline and every
+catalog column (area, bounds, shape metrics, centroids) plus the region. Outlines come
+from the memory-mapped geometry store EXPORT_CHUNK_ROWS icebergs at a time and each chunk
+is appended to the output file, so an export is never built in memory as a whole.
+
+Exports are written below EXPORT_DIR under a name tied to their content and the store
+build, and reused until the catalog changes. The finished file is downloaded from the
+tile server (modules.tiles), which streams it in chunks from /exports/<name>; the viewer
+links there with tiles.export_url, so the file is not loaded into the Streamlit process:
+
+    path = export_file("GeoPackage", site="KOG")
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+import geopandas as gpd
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+from .catalog import CATALOG_CRS
+from .data_path import EXPORT_DIR, GLACIER_LOCATIONS_CSV
+from .figure_cache import evict
+from .geometry_store import load_geometry_store
+from .instrumentation import timed
+from .loaders import load_glacier_sites
+from .melt_store import add_group_columns
+
+EXPORT_FORMATS = {"GeoParquet": ".parquet", "GeoPackage": ".gpkg", "Shapefile (zip)": ".zip"}
+EXPORT_CHUNK_ROWS = 10_000
+DEFAULT_EXPORT_CACHE_MB = 4096
+
+# Bookkeeping columns of the catalog that are left out of exports
+INTERNAL_COLUMNS = ["path", "mtime", "size"]
+EXPORT_LAYER = "icebergs"
+
+# Shapefile field names are limited to 10 characters
+SHAPEFILE_COLUMNS = {
+    "aspect_ratio": "aspect",
+    "dominant_angle": "dom_angle",
+    "centroid_x": "cent_x",
+    "centroid_y": "cent_y",
+    "centroid_lon": "cent_lon",
+    "centroid_lat": "cent_lat",
+}
+
+
+def export_attributes(store):
+    """
+    Attribute rows of the store with the region of their site.
+    """
+    if os.path.exists(GLACIER_LOCATIONS_CSV):
+        glacier_sites = load_glacier_sites()
+    else:
+        glacier_sites = pd.DataFrame(columns=["Glacier_ID", "Region"])
+    attributes = store.attributes.drop(columns=INTERNAL_COLUMNS, errors="ignore")
+    regions = add_group_columns(attributes[["site", "early_date"]].copy(), glacier_sites)["region"]
+    return attributes.assign(region=regions)
+
+
+def export_rows(attributes, site=None, date_pair=None, region=None):
+    """
+    Positions of the icebergs matching every given filter (None means all).
+    """
+    mask = pd.Series(True, index=attributes.index)
+    for column, value in (("site", site), ("date_pair", date_pair), ("region", region)):
+        if value is not None:
+            mask &= attributes[column] == value
+    return mask.to_numpy().nonzero()[0]
+
+
+def iter_export_chunks(store, attributes, rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    GeoDataFrames of at most chunk_rows icebergs, outlines built from the store per chunk.
+    """
+    for start in range(0, len(rows), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        yield gpd.GeoDataFrame(
+            attributes.iloc[chunk].reset_index(drop=True),
+            geometry=gpd.GeoSeries(store.geometries(chunk), crs=CATALOG_CRS),
+        )
+
+
+def geoparquet_table(chunk):
+    """
+    Arrow table of a chunk with a WKB geometry column and GeoParquet 1.0 metadata.
+    """
+    table = pa.Table.from_pandas(pd.DataFrame(chunk.drop(columns="geometry")), preserve_index=False)
+    table = table.append_column("geometry", pa.array(shapely.to_wkb(chunk.geometry.to_numpy()), type=pa.binary()))
+    geo = {
+        "version": "1.0.0",
+        "primary_column": "geometry",
+        "columns": {"geometry": {"encoding": "WKB", "geometry_types": [], "crs": chunk.crs.to_json_dict()}},
+    }
+    return table.replace_schema_metadata({**table.schema.metadata, b"geo": json.dumps(geo).encode()})
+
+
+def write_geoparquet(chunks, path):
+    writer = None
+    try:
+        for chunk in chunks:
+            table = geoparquet_table(chunk)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_ogr(chunks, path, driver):
+    for i, chunk in enumerate(chunks):
+        chunk.to_file(path, driver=driver, layer=EXPORT_LAYER, mode="w" if i == 0 else "a")
+
+
+def write_zipped_shapefile(chunks, path, name):
+    # The shapefile is written to a scratch folder, then its sidecars are zipped file by file
+    chunks = (chunk.rename(columns=SHAPEFILE_COLUMNS) for chunk in chunks)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(path)) as tmp:
+        write_ogr(chunks, os.path.join(tmp, f"{name}.shp"), "ESRI Shapefile")
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for entry in sorted(os.scandir(tmp), key=lambda entry: entry.name):
+                archive.write(entry.path, entry.name)
+
+
+def export_name(fmt, store, **filters):
+    """
+    File name of an export: its filters, and a digest of them and the store build.
+    """
+    label = "_".join(str(value) for value in filters.values() if value is not None) or "catalog"
+    payload = json.dumps([fmt, filters, store.manifest["attributes"]], sort_keys=True)
+    digest = hashlib.sha256(payload.encode()).hexdigest()[:12]
+    return f"icebergs_{label}_{digest}{EXPORT_FORMATS[fmt]}"
+
+
+@timed("export.write")
+def export_file(fmt, site=None, date_pair=None, region=None, export_dir=EXPORT_DIR):
+    """
+    Path of the export of the icebergs matching the filters in `fmt` (a key of
+    EXPORT_FORMATS), writing it first unless it already exists for this catalog.
+    Returns None when no iceberg matches.
+    """
+    store = load_geometry_store()
+    filters = {"site": site, "date_pair": date_pair, "region": region}
+    path = os.path.join(export_dir, export_name(fmt, store, **filters))
+    if os.path.exists(path):
+        os.utime(path)  # Mark as recently used for eviction
+        return path
+
+    attributes = export_attributes(store)
+    rows = export_rows(attributes, **filters)
+    if len(rows) == 0:
+        return None
+
+    os.makedirs(export_dir, exist_ok=True)
+    chunks = iter_export_chunks(store, attributes, rows)
+    # Written in a scratch folder and moved in once complete, so a half-written export is never served
+    with tempfile.TemporaryDirectory(dir=export_dir) as tmp:
+        tmp_path = os.path.join(tmp, os.path.basename(path))
+        if fmt == "GeoParquet":
+            write_geoparquet(chunks, tmp_path)
+        elif fmt == "GeoPackage":
+            write_ogr(chunks, tmp_path, "GPKG")
+        else:
+            write_zipped_shapefile(chunks, tmp_path, EXPORT_LAYER)
+        os.replace(tmp_path, path)
+
+    max_bytes = int(os.environ.get("ICE_AGE_EXPORT_CACHE_MB", DEFAULT_EXPORT_CACHE_MB)) * 1024 * 1024
+    evict(export_dir, max_bytes)
+    return path
+
+
+def export_path(name, export_dir=EXPORT_DIR):
+    """
+    Path of an existing export from its file name, or None (also for names that try to
+    leave export_dir).
+    """
+    if name != os.path.basename(name) or not name.endswith(tuple(EXPORT_FORMATS.values())):
+        return None
+    path = os.path.join(export_dir, name)
+    return path if os.path.isfile(path) else None
+
+
+def stream_export(path, out, chunk_bytes=1024 * 1024):
+    with open(path, "rb") as f:
+        shutil.copyfileobj(f, out, chunk_bytes)
@@ -0,0 +1,306 @@
+"""
+Content-addressed cache of rendered figures.
+
+A figure is identified by its kind, the site and date pair it shows, a fingerprint of
+the data it is drawn from and its style parameters. The rendered PNG/SVG bytes are kept
+under FIGURE_CACHE_DIR and served straight to st.image and download buttons, so an
+unchanged figure is never drawn by matplotlib twice. The directory is bounded in size
+(ICE_AGE_FIGURE_CACHE_MB, 1024 MB by default), evicting the least recently used files.
+
+Pre-render every figure of the catalog with:
+
+    python -m modules.figure_cache --warm
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+
+from .cache import atomic_path, file_fingerprint
+from .data_path import CATALOG_INDEX_PATH, FIGURE_CACHE_DIR, HISTO_CSV_FILE_PATH, MELT_RATES_DIR, MELT_STORE_PATH
+from .instrumentation import span
+from .loaders import load_melt_statistics
+from .melt_store import group_correlations
+
+# The catalog and plotting modules (geopandas, shapely) are imported inside the functions
+# that need them: a page showing cached figures, like Home, never loads them.
+
+DEFAULT_FIGURE_CACHE_MB = 1024
+FIGURE_DPI = 200  # Same resolution st.pyplot renders at
+
+# Size of one panel of the viewer figures (quartiles and grid); their outlines are
+# simplified to the pixel size of such a panel at FIGURE_DPI
+PANEL_INCHES = 4
+
+# Icebergs per figure of the viewer grid
+GRID_PAGE_SIZE = 12
+
+
+def figure_key(kind, **params):
+    """
+    Hex digest identifying a figure; `params` must be JSON-serializable (str() fallback).
+    """
+    payload = json.dumps([kind, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def icebergs_fingerprint(icebergs):
+    """
+    Fingerprint of catalog rows: changes only when one of their shapefiles changes.
+    """
+    from .catalog import KEY_COLUMNS
+
+    files = icebergs[KEY_COLUMNS + ["mtime", "size"]].to_csv(index=False)
+    return hashlib.sha256(files.encode()).hexdigest()
+
+
+def cached_figure(kind, render, fmt="png", cache_dir=FIGURE_CACHE_DIR, **params):
+    """
+    Return the bytes of a rendered figure. `render` is only called (and its figure closed)
+    when no figure with the same kind, format and params has been rendered before.
+    """
+    path = os.path.join(cache_dir, f"{figure_key(kind, fmt=fmt, **params)}.{fmt}")
+    if os.path.exists(path):
+        os.utime(path)  # Mark as recently used for eviction
+        with span(f"figure.{kind}.cached"), open(path, "rb") as f:
+            return f.read()
+
+    # matplotlib is only imported once a figure actually has to be drawn
+    import matplotlib
+
+    matplotlib.use("Agg")  # Figures are only ever rendered to bytes here
+    import matplotlib.pyplot as plt
+
+    with span(f"figure.{kind}.draw"):
+        fig = render()
+    buffer = io.BytesIO()
+    try:
+        with span(f"figure.{kind}.encode"):
+            fig.savefig(buffer, format=fmt, bbox_inches="tight", dpi=FIGURE_DPI)
+    finally:
+        plt.close(fig)
+    data = buffer.getvalue()
+
+    with atomic_path(path) as tmp_path, open(tmp_path, "wb") as f:
+        f.write(data)
+
+    max_bytes = int(os.environ.get("ICE_AGE_FIGURE_CACHE_MB", DEFAULT_FIGURE_CACHE_MB)) * 1024 * 1024
+    evict(cache_dir, max_bytes)
+    return data
+
+
+def evict(cache_dir=FIGURE_CACHE_DIR, max_bytes=DEFAULT_FIGURE_CACHE_MB * 1024 * 1024):
+    """
+    Delete the least recently used figures until the cache fits in max_bytes.
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and not entry.name.endswith(".tmp"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def figure_quartiles(icebergs):
+    """
+    plotting.assign_quartiles with outlines simplified for the panels the viewer figures
+    are rendered with.
+    """
+    from .plotting import assign_quartiles
+
+    return assign_quartiles(icebergs, PANEL_INCHES, FIGURE_DPI)
+
+
+def figure_icebergs(store, site, date_pair):
+    """
+    Icebergs of a date pair from the geometry store, with only the outlines that
+    figure_quartiles reads.
+    """
+    from .plotting import quartile_levels
+
+    rows = store.attributes.iloc[store.rows(site, date_pair)]
+    return store.icebergs(site, date_pair, quartile_levels(rows, PANEL_INCHES, FIGURE_DPI))
+
+
+def quartile_figure(site, date_pair, icebergs, quartiles=None, fmt="png"):
+    """
+    Quartile comparison figure of one date pair (see plotting.iceberg_quartiles).
+    """
+    def render():
+        from .plotting import iceberg_quartiles
+
+        return iceberg_quartiles(quartiles if quartiles is not None else figure_quartiles(icebergs), PANEL_INCHES)
+
+    return cached_figure(
+        "quartiles", render, fmt,
+        site=site, date_pair=date_pair, data=icebergs_fingerprint(icebergs), panel_inches=PANEL_INCHES,
+    )
+
+
+def iceberg_grid_figure(site, date_pair, icebergs, quartiles, page, per_page=GRID_PAGE_SIZE, fmt="png"):
+    """
+    One page of the viewer's per-iceberg grid (see plotting.iceberg_grid).
+    """
+    early_date = date_pair.split('-')[0]
+
+    def render():
+        from .plotting import iceberg_grid
+
+        return iceberg_grid(quartiles, early_date, page, per_page, panel_inches=PANEL_INCHES)
+
+    return cached_figure(
+        "iceberg_grid", render, fmt,
+        site=site, date_pair=date_pair, data=icebergs_fingerprint(icebergs),
+        page=page, per_page=per_page, panel_inches=PANEL_INCHES,
+    )
+
+
+def distribution_figure(fmt="png"):
+    """
+    Number of icebergs per study site (see plotting.distribution_plot).
+    """
+    def render():
+        from .plotting import distribution_plot
+
+        return distribution_plot().gcf()
+
+    return cached_figure(
+        "distribution", render, fmt,
+        data=file_fingerprint(HISTO_CSV_FILE_PATH),
+    )
+
+
+def correlogram_figure(csv_file_path, fmt="png"):
+    """
+    Correlogram of one melt-rate table (see plotting.correlation_heatmap).
+    """
+    def render():
+        from .plotting import correlation_heatmap
+
+        return correlation_heatmap(load_melt_statistics(csv_file_path)["corr"])
+
+    return cached_figure(
+        "correlogram", render, fmt,
+        data=file_fingerprint(csv_file_path),
+    )
+
+
+def group_correlogram_figure(by, group, fmt="png"):
+    """
+    Correlogram of one group of the melt-rate store (see melt_store.group_correlations).
+    """
+    def render():
+        from .plotting import correlation_heatmap
+
+        return correlation_heatmap(group_correlations(by)[tuple(group)])
+
+    return cached_figure(
+        "group_correlogram", render, fmt,
+        data=file_fingerprint(MELT_STORE_PATH), by=list(by), group=list(group),
+    )
+
+
+def size_distribution_figure(distributions, source, by, groups, label, fmt="png"):
+    """
+    Size distributions of some groups (see plotting.size_distribution_plot). `source`
+    is the catalog or melt-store file the distributions were computed from.
+    """
+    def render():
+        from .plotting import size_distribution_plot
+
+        return size_distribution_plot(distributions, groups, label)
+
+    return cached_figure(
+        "size_distribution", render, fmt,
+        data=file_fingerprint(source), by=list(by), groups=list(groups), label=label,
+    )
+
+
+def density_figure(density, label, log=False, fmt="png"):
+    """
+    Density raster image (see plotting.density_plot); `density` comes from
+    density.density_grid.
+    """
+    source = MELT_STORE_PATH if density["statistic"] == "melt_rate" else CATALOG_INDEX_PATH
+
+    def render():
+        from .plotting import density_plot
+
+        return density_plot(density, label, log)
+
+    return cached_figure(
+        "density", render, fmt,
+        data=file_fingerprint(source), bounds=list(density["bounds"]), resolution=density["resolution"],
+        statistic=density["statistic"], points=density["points"], label=label, log=log,
+    )
+
+
+def report_failure(label, exc):
+    print(f"Failed to render {label}: {type(exc).__name__}: {exc}")
+
+
+def warm(fmt="png"):
+    """
+    Render every figure the pages can show for the current catalog and melt-rate tables.
+    Returns the number of figures visited (already cached ones included). A figure that
+    fails is reported and skipped, the others are still rendered.
+    """
+    from .catalog import catalog_date_pairs, catalog_icebergs, catalog_sites, load_catalog
+
+    count = 0
+    catalog = load_catalog()
+    for site in catalog_sites(catalog):
+        for date_pair in catalog_date_pairs(catalog, site):
+            try:
+                icebergs = catalog_icebergs(catalog, site, date_pair)
+                quartiles = figure_quartiles(icebergs)
+                quartile_figure(site, date_pair, icebergs, quartiles, fmt)
+                num_pages = -(-len(quartiles) // GRID_PAGE_SIZE)
+                for page in range(num_pages):
+                    iceberg_grid_figure(site, date_pair, icebergs, quartiles, page, fmt=fmt)
+                count += 1 + num_pages
+            except Exception as exc:
+                report_failure(f"{site} {date_pair}", exc)
+
+    if os.path.exists(HISTO_CSV_FILE_PATH):
+        try:
+            distribution_figure(fmt)
+            count += 1
+        except Exception as exc:
+            report_failure("the study-site distribution", exc)
+
+    for root, _, files in os.walk(MELT_RATES_DIR):
+        for name in sorted(files):
+            if name.endswith("_iceberg_meltinfo.csv"):
+                try:
+                    correlogram_figure(os.path.join(root, name), fmt)
+                    count += 1
+                except Exception as exc:
+                    report_failure(os.path.join(root, name), exc)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the rendered figure cache.")
+    parser.add_argument("--warm", action="store_true", help="Pre-render every figure of the catalog.")
+    parser.add_argument("--format", default="png", choices=["png", "svg"])
+    args = parser.parse_args()
+
+    if args.warm:
+        print(f"{warm(args.format)} figures cached in {FIGURE_CACHE_DIR}")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Compact, memory-mapped store of every iceberg outline of the catalog.
+
+Shapely objects cost far more memory than their coordinates, so the outlines of the
+catalog (the full EPSG:3413 outline and each simplification of modules.simplify) are
+also written as flat arrays, the layout of shapely.to_ragged_array, in a folder per build:
+
+    <build>/<level>.coords.npy     (n, 2) float64 coordinates of every ring
+    <build>/<level>.offsets0.npy   ring -> first coordinate
+    <build>/<level>.offsets1.npy   polygon -> first ring
+    <build>/<level>.offsets2.npy   iceberg -> first polygon (multipolygon levels only)
+
+next to <build>/attributes.parquet, the catalog rows without their geometry columns, in
+the same order. manifest.json names the current build and is swapped in last, so readers
+never see a half-written store. Builds hold an exclusive lock on the store folder, so the
+worker and a page rebuilding at the same time do not delete each other's files; only
+builds older than the one of the manifest are removed.
+
+The arrays are opened with np.load(mmap_mode="r"): every session and worker process reads
+the same pages of the OS page cache, and geometries are only built for the rows and
+outline levels asked for.
+
+    store = load_geometry_store()
+    icebergs = store.icebergs("KOG", "20170515-20170611")
+
+Build or refresh the store with:
+
+    python -m modules.geometry_store
+"""
+import argparse
+import fcntl
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from .cache import atomic_path, file_cache
+from .catalog import CATALOG_CRS, build_catalog, catalog_fingerprint, load_catalog
+from .data_path import CATALOG_INDEX_PATH, GEOMETRY_STORE_DIR
+from .instrumentation import timed
+from .simplify import SIMPLIFIED_COLUMNS
+
+GEOMETRY_LEVELS = ["geometry"] + SIMPLIFIED_COLUMNS
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "build.lock"
+
+
+class GeometryStore:
+    """
+    Read-only view of a built store: the attribute table and, per level, the
+    memory-mapped coordinate and offset arrays.
+    """
+
+    def __init__(self, store_dir, manifest):
+        self.store_dir = store_dir
+        self.manifest = manifest
+        self.attributes = pd.read_parquet(os.path.join(store_dir, manifest["attributes"]))
+        self.levels = {}
+        for level, entry in manifest["levels"].items():
+            coords = np.load(os.path.join(store_dir, entry["coords"]), mmap_mode="r")
+            offsets = [np.load(os.path.join(store_dir, name), mmap_mode="r") for name in entry["offsets"]]
+            self.levels[level] = (shapely.GeometryType(entry["type"]), coords, offsets)
+
+    def __len__(self):
+        return len(self.attributes)
+
+    def __sizeof__(self):
+        # The mapped arrays live in the page cache, shared with every other reader
+        return int(self.attributes.memory_usage(deep=True).sum())
+
+    def rows(self, site=None, date_pair=None):
+        """
+        Positions of the icebergs of a site and/or date pair, in catalog order.
+        """
+        mask = np.ones(len(self.attributes), dtype=bool)
+        if site is not None:
+            mask &= (self.attributes["site"] == site).to_numpy()
+        if date_pair is not None:
+            mask &= (self.attributes["date_pair"] == date_pair).to_numpy()
+        return np.flatnonzero(mask)
+
+    def _ragged(self, level, start, stop):
+        """
+        Coordinates and rebased offsets of the contiguous rows start..stop-1. The
+        coordinates are a view of the mapped file, nothing is copied until rebasing.
+        """
+        geom_type, coords, offsets = self.levels[level]
+        first, last = start, stop
+        sliced = []
+        for offset in reversed(offsets):
+            part = np.asarray(offset[first:last + 1])
+            sliced.append(part - part[0])
+            first, last = part[0], part[-1]
+        return geom_type, coords[first:last], tuple(reversed(sliced))
+
+    def _runs(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        return [(run[0], run[-1] + 1) for run in np.split(rows, breaks)]
+
+    def geometries(self, rows, level="geometry"):
+        """
+        Shapely outlines (EPSG:3413) of the given positions, built from the mapped arrays.
+        """
+        parts = []
+        for start, stop in self._runs(rows):
+            geom_type, coords, offsets = self._ragged(level, start, stop)
+            parts.append(shapely.from_ragged_array(geom_type, np.ascontiguousarray(coords), offsets))
+        return np.concatenate(parts) if parts else np.array([], dtype=object)
+
+    def icebergs(self, site=None, date_pair=None, levels=("geometry",)):
+        """
+        Catalog rows of a site and date pair as a GeoDataFrame, with the outlines of
+        `levels` (the first one becomes the geometry column) built for those rows only.
+        Same columns as catalog_icebergs, without the EPSG:4326 outline and the levels
+        not asked for.
+        """
+        rows = self.rows(site, date_pair)
+        icebergs = gpd.GeoDataFrame(
+            self.attributes.iloc[rows].reset_index(drop=True),
+            geometry=gpd.GeoSeries(self.geometries(rows, levels[0]), crs=CATALOG_CRS),
+        )
+        for level in levels[1:]:
+            if level in self.levels or len(rows) == 0:
+                icebergs[level] = gpd.GeoSeries(self.geometries(rows, level), crs=CATALOG_CRS)
+        return icebergs
+
+
+def ragged_arrays(geometries):
+    """
+    (geometry type, coordinates, offsets) of an array of polygons and multipolygons.
+    """
+    geom_type, coords, offsets = shapely.to_ragged_array(geometries, include_z=False)
+    return int(geom_type), coords.astype(np.float64), [np.asarray(offset, dtype=np.int64) for offset in offsets]
+
+
+@contextmanager
+def build_lock(store_dir=GEOMETRY_STORE_DIR):
+    """
+    Exclusive lock on the store folder, held while a build runs. Waits for a build of
+    another process or session to finish.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, LOCK_NAME), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def is_current(manifest, index_path=CATALOG_INDEX_PATH):
+    return manifest is not None and manifest["catalog"] == list(catalog_fingerprint(index_path))
+
+
+@timed("geometry_store.build")
+def build_geometry_store(index_path=CATALOG_INDEX_PATH, store_dir=GEOMETRY_STORE_DIR, force=True):
+    """
+    Write every outline level of the catalog to a new build folder of store_dir, then swap
+    the manifest in and delete the builds older than it. Returns the new manifest. With
+    force=False, a store that is already current (e.g. built by another process while
+    this one waited for the lock) is kept and its manifest returned.
+    """
+    with build_lock(store_dir):
+        manifest = read_manifest(store_dir)
+        if not force and is_current(manifest, index_path):
+            return manifest
+
+        catalog = load_catalog(index_path)
+        build = str(time.time_ns())
+        os.makedirs(os.path.join(store_dir, build))
+
+        # An empty catalog has no outline to write (shapely cannot type an empty ragged
+        # array): its store is the manifest and an empty attribute table
+        levels = {}
+        for level in GEOMETRY_LEVELS:
+            if level not in catalog.columns or catalog.empty:
+                continue
+            geom_type, coords, offsets = ragged_arrays(catalog[level].to_numpy())
+            entry = {"type": geom_type, "coords": os.path.join(build, f"{level}.coords.npy"), "offsets": []}
+            np.save(os.path.join(store_dir, entry["coords"]), coords)
+            for i, offset in enumerate(offsets):
+                name = os.path.join(build, f"{level}.offsets{i}.npy")
+                np.save(os.path.join(store_dir, name), offset)
+                entry["offsets"].append(name)
+            levels[level] = entry
+
+        geometry_columns = [column for column in catalog.columns if catalog[column].dtype == "geometry"]
+        attributes = os.path.join(build, "attributes.parquet")
+        pd.DataFrame(catalog.drop(columns=geometry_columns)).to_parquet(os.path.join(store_dir, attributes), index=False)
+
+        manifest = {
+            "build": build,
+            "catalog": list(catalog_fingerprint(index_path)),
+            "count": len(catalog),
+            "attributes": attributes,
+            "levels": levels,
+        }
+        with atomic_path(os.path.join(store_dir, MANIFEST_NAME)) as tmp_path, open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        # Readers of an older build keep their mappings, the files are only unlinked
+        for entry in os.scandir(store_dir):
+            if entry.is_dir() and entry.name.isdigit() and int(entry.name) < int(build):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            elif entry.is_file() and entry.name not in (MANIFEST_NAME, LOCK_NAME):
+                os.remove(entry.path)  # Left over by an interrupted write or the flat layout
+    return manifest
+
+
+def read_manifest(store_dir=GEOMETRY_STORE_DIR):
+    try:
+        with open(os.path.join(store_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def read_geometry_store(manifest_path):
+    store_dir = os.path.dirname(manifest_path)
+    manifest = read_manifest(store_dir)
+    try:
+        return GeometryStore(store_dir, manifest)
+    except FileNotFoundError:
+        # A newer build replaced this one between reading the manifest and its files
+        if read_manifest(store_dir) == manifest:
+            raise
+        return GeometryStore(store_dir, read_manifest(store_dir))
+
+
+def load_geometry_store(index_path=CATALOG_INDEX_PATH, store_dir=GEOMETRY_STORE_DIR):
+    """
+    The store of the current catalog, (re)built first when the catalog changed since.
+    One GeometryStore is shared by all sessions until the store is rebuilt.
+    """
+    # Only the fingerprint of the catalog is needed here, it is not read unless the store is stale
+    if not os.path.exists(index_path):
+        build_catalog(index_path=index_path)
+    if not is_current(read_manifest(store_dir), index_path):
+        build_geometry_store(index_path, store_dir, force=False)
+    manifest_path = os.path.join(store_dir, MANIFEST_NAME)
+    try:
+        return file_cache.load(read_geometry_store, manifest_path)
+    except FileNotFoundError:
+        # Files of the current build went missing: rebuild rather than fail on every call
+        build_geometry_store(index_path, store_dir)
+        return file_cache.load(read_geometry_store, manifest_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the memory-mapped geometry store of the catalog.")
+    parser.add_argument("--index", default=CATALOG_INDEX_PATH)
+    parser.add_argument("--store-dir", default=GEOMETRY_STORE_DIR)
+    args = parser.parse_args()
+
+    manifest = build_geometry_store(args.index, args.store_dir)
+    build_dir = os.path.join(args.store_dir, manifest["build"])
+    size = sum(entry.stat().st_size for entry in os.scandir(build_dir))
+    print(f"{manifest['count']} icebergs, {len(manifest['levels'])} outline levels, {size / 1e6:.1f} MB in {args.store_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Timing and memory instrumentation of page renders.
+
+Wrap a stage in `with span("name"):` or decorate it with `@timed("name")`. Spans are
+aggregated per rerun (count, total and slowest time, peak memory) while a run is active,
+i.e. inside `page_run(...)`, which streamlit_app.py opens around every page; outside a
+run (CLI tools, worker threads) they cost a perf_counter call and record nothing.
+
+Environment variables:
+
+    ICE_AGE_PROFILE=1          also trace memory with tracemalloc (slows allocations down)
+                               and append every run to INSTRUMENTATION_LOG_PATH as JSON lines
+    ICE_AGE_PROFILE_LOG=path   log to this file instead
+    ICE_AGE_DEBUG=1            show the breakdown in the sidebar of every page
+                               (or open a page with ?debug=1)
+
+tracemalloc is process-wide, so with several sessions rendering at once the memory of
+a span also includes what the other sessions allocated meanwhile.
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+from .data_path import INSTRUMENTATION_LOG_PATH
+
+_current_run = contextvars.ContextVar("ice_age_run", default=None)
+_log_lock = threading.Lock()
+
+
+def profiling_enabled():
+    return os.environ.get("ICE_AGE_PROFILE", "") not in ("", "0")
+
+
+class Run:
+    """
+    Spans recorded during one rerun of a page, aggregated by name in first-seen order.
+    """
+
+    def __init__(self, page, trace_memory=False):
+        self.page = page
+        self.trace_memory = trace_memory
+        self.started = time.time()
+        self.seconds = None
+        self.peak_bytes = None
+        self.spans = {}
+        self.stack = []  # [name, peak bytes seen in nested spans] of open spans
+
+    def open(self, name):
+        # Register the span when it starts, so parents are listed before their children
+        self.spans.setdefault(
+            name, {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "peak_bytes": None, "depth": len(self.stack)}
+        )
+        self.stack.append([name, 0])
+        return self.stack[-1]
+
+    def add(self, name, seconds, peak_bytes):
+        stats = self.spans[name]
+        stats["count"] += 1
+        stats["seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+        if peak_bytes is not None:
+            stats["peak_bytes"] = max(stats["peak_bytes"] or 0, peak_bytes)
+
+    def as_dict(self):
+        return {
+            "page": self.page,
+            "started": self.started,
+            "seconds": self.seconds,
+            "peak_bytes": self.peak_bytes,
+            "spans": self.spans,
+        }
+
+
+def _traced_peak(frame):
+    # Peak traced memory since the last reset, or since a nested span ended
+    return max(frame[1], tracemalloc.get_traced_memory()[1])
+
+
+@contextlib.contextmanager
+def span(name):
+    """
+    Time the enclosed block (and its peak traced memory) under `name` in the current run.
+    """
+    run = _current_run.get()
+    if run is None:
+        yield
+        return
+
+    memory = run.trace_memory and tracemalloc.is_tracing()
+    if memory:
+        start_bytes = tracemalloc.get_traced_memory()[0]
+        if run.stack:
+            run.stack[-1][1] = _traced_peak(run.stack[-1])
+        tracemalloc.reset_peak()
+    frame = run.open(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        run.stack.pop()
+        peak_bytes = None
+        if memory:
+            peak = _traced_peak(frame)
+            peak_bytes = max(0, peak - start_bytes)
+            # The enclosing span saw at least this peak
+            if run.stack:
+                run.stack[-1][1] = max(run.stack[-1][1], peak)
+            tracemalloc.reset_peak()
+        run.add(name, seconds, peak_bytes)
+
+
+def timed(name=None):
+    """
+    Decorator recording every call of the function as a span (named after the function
+    by default).
+    """
+    def decorator(func):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextlib.contextmanager
+def page_run(page, trace_memory=None):
+    """
+    Record the spans of one page render and yield the Run. With profiling enabled the
+    run is also appended to the log file when it ends.
+    """
+    if trace_memory is None:
+        trace_memory = profiling_enabled()
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    run = Run(page, trace_memory)
+    token = _current_run.set(run)
+    if trace_memory:
+        tracemalloc.reset_peak()
+        start_bytes = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield run
+    finally:
+        run.seconds = time.perf_counter() - start
+        if trace_memory:
+            run.peak_bytes = max(0, tracemalloc.get_traced_memory()[1] - start_bytes)
+        _current_run.reset(token)
+        if profiling_enabled():
+            export_run(run)
+
+
+def current_run():
+    return _current_run.get()
+
+
+def export_run(run, log_path=None):
+    """
+    Append the run as one JSON line to log_path (ICE_AGE_PROFILE_LOG or
+    INSTRUMENTATION_LOG_PATH by default).
+    """
+    log_path = log_path or os.environ.get("ICE_AGE_PROFILE_LOG", INSTRUMENTATION_LOG_PATH)
+    directory = os.path.dirname(log_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    line = json.dumps(run.as_dict())
+    with _log_lock, open(log_path, "a") as f:
+        f.write(line + "\n")
+
+
+def debug_requested():
+    import streamlit as st
+
+    if os.environ.get("ICE_AGE_DEBUG", "") not in ("", "0"):
+        return True
+    return st.query_params.get("debug", "0") not in ("", "0")
+
+
+def debug_panel(run):
+    """
+    Sidebar breakdown of a finished run, with the process-wide file cache counters.
+    """
+    import pandas as pd
+    import streamlit as st
+
+    from .cache import cache_stats
+
+    with st.sidebar.expander("⏱️ Render timings", expanded=False):
+        st.caption(f"{run.page}: {run.seconds:.3f} s")
+        if run.peak_bytes is not None:
+            st.caption(f"Peak traced memory: {run.peak_bytes / 2**20:.1f} MB")
+
+        if run.spans:
+            rows = [
+                {
+                    "stage": " " * stats["depth"] + name,
+                    "calls": stats["count"],
+                    "total ms": round(stats["seconds"] * 1000, 1),
+                    "max ms": round(stats["max_seconds"] * 1000, 1),
+                    "peak MB": None if stats["peak_bytes"] is None else round(stats["peak_bytes"] / 2**20, 2),
+                }
+                for name, stats in run.spans.items()
+            ]
+            st.dataframe(pd.DataFrame(rows), hide_index=True)
+        else:
+            st.caption("No instrumented stage ran.")
+
+        stats = cache_stats()
+        st.caption(f"File cache: {stats['entries']} entries, {stats['bytes'] / 2**20:.1f} MB")
+        st.download_button(
+            "Download timings (JSON)", json.dumps(run.as_dict(), indent=2),
+            file_name="ice-age-timings.json", mime="application/json",
+        )
@@ -0,0 +1,126 @@
+"""
+Cached loaders for every data file the pages read.
+
+Each loader goes through modules.cache, so a file is parsed once per process (shared by
+all sessions) and again only after it changes on disk. See cache_stats() for hit/miss
+counters.
+"""
+import json
+import os
+
+import pandas as pd
+
+from .cache import atomic_path, cached_file_loader
+from .data_path import (
+    GLACIER_LOCATIONS_CSV,
+    GREENLAND_GEOJSON_PATH,
+    HISTO_CSV_FILE_PATH,
+    MELT_RATES_DIR,
+    NATURAL_EARTH_PATH,
+)
+from .melt_rates import MELT_PREVIEW_ROWS, melt_preview, melt_statistics
+
+# Simplification of the Greenland outline of the Home map, in degrees (about 1 km)
+GREENLAND_TOLERANCE = 0.01
+
+
+@cached_file_loader
+def read_glacier_sites(path):
+    return pd.read_csv(path)
+
+
+@cached_file_loader
+def read_date_pairings(path):
+    return pd.read_csv(path)
+
+
+@cached_file_loader
+def read_natural_earth(path):
+    # geopandas is only needed to rebuild the Greenland outline (see build_greenland_outline)
+    import geopandas as gpd
+
+    return gpd.read_file(path)
+
+
+@cached_file_loader
+def read_geojson(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+@cached_file_loader
+def read_melt_rates(path):
+    return pd.read_csv(path)
+
+
+read_melt_statistics = cached_file_loader(melt_statistics)
+read_melt_preview = cached_file_loader(melt_preview)
+
+
+def load_glacier_sites():
+    """
+    Study sites with 'LAT', 'LON', 'Official_n', 'Glacier_ID' and 'Region' columns.
+    """
+    return read_glacier_sites(GLACIER_LOCATIONS_CSV)
+
+
+def load_date_pairings():
+    """
+    Number of icebergs per study site, for the Home histogram.
+    """
+    return read_date_pairings(HISTO_CSV_FILE_PATH)
+
+
+def load_natural_earth():
+    return read_natural_earth(NATURAL_EARTH_PATH)
+
+
+def build_greenland_outline(natural_earth_path=NATURAL_EARTH_PATH, geojson_path=GREENLAND_GEOJSON_PATH,
+                            tolerance=GREENLAND_TOLERANCE):
+    """
+    Write the Greenland polygon of Natural Earth, in EPSG:4326 and simplified for display,
+    as GeoJSON.
+    """
+    world = read_natural_earth(natural_earth_path)
+    greenland = world.loc[world["NAME"] == "Greenland", ["NAME", "geometry"]].to_crs("EPSG:4326")
+    greenland["geometry"] = greenland.simplify(tolerance, preserve_topology=True)
+
+    # Write next to the target and swap it in, so readers never see a half-written file
+    with atomic_path(geojson_path) as tmp_path, open(tmp_path, "w") as f:
+        f.write(greenland.to_json(drop_id=True))
+
+
+def load_greenland_outline():
+    """
+    GeoJSON dict of the Greenland outline, rebuilt only when the Natural Earth file is
+    newer than the cached GeoJSON.
+    """
+    if not os.path.exists(GREENLAND_GEOJSON_PATH) or (
+        os.path.getmtime(NATURAL_EARTH_PATH) > os.path.getmtime(GREENLAND_GEOJSON_PATH)
+    ):
+        build_greenland_outline()
+    return read_geojson(GREENLAND_GEOJSON_PATH)
+
+
+def load_melt_rates(csv_file_path):
+    """
+    One <site>_<early>-<later>_iceberg_meltinfo.csv melt-rate table.
+    """
+    return read_melt_rates(csv_file_path)
+
+
+def load_melt_statistics(csv_file_path):
+    """
+    {"rows": ..., "corr": ...} of a melt-rate table, computed in one streaming pass
+    without loading the table (see modules.melt_rates).
+    """
+    return read_melt_statistics(csv_file_path)
+
+
+def load_melt_preview(csv_file_path, nrows=MELT_PREVIEW_ROWS):
+    return read_melt_preview(csv_file_path, nrows)
+
+
+def melt_rates_path(site_name, early_date, later_date):
+    date_pair = f"{early_date}-{later_date}"
+    return os.path.join(MELT_RATES_DIR, site_name, date_pair, f"{site_name}_{date_pair}_iceberg_meltinfo.csv")
@@ -0,0 +1,352 @@
+"""
+Folium maps: the overview map of Greenland and the iceberg maps of the spatial page.
+
+Kept apart from modules.plotting so pages that only show matplotlib figures never import
+folium, and pages that only show maps never import matplotlib. The overview map only
+reads small GeoJSON and CSV files, so geopandas, shapely and the catalog are imported
+inside the iceberg map functions.
+"""
+import math
+
+import folium
+import numpy as np
+from streamlit_folium import st_folium
+
+from .cache import cached_file_loader
+from .data_path import CATALOG_INDEX_PATH, MELT_STORE_PATH
+from .instrumentation import span, timed
+from .loaders import load_glacier_sites, load_greenland_outline
+from .tiles import add_vector_tile_layer
+
+
+# Site marker colors per region
+REGION_COLORS = {
+    'SE': 'red',
+    'CE': 'orange',
+    'CW': 'yellow',
+    'NW': 'green',
+    'NE': 'lime',
+    'NO': 'blue',
+    'SW': 'purple'
+}
+
+
+def overview_map(map_style, tile_url=None):
+    """
+    Overview of Greenland with all study sites. Pass the URL template of the tile server
+    (modules.tiles) as tile_url to also draw every iceberg outline of the catalog.
+
+    The map itself never changes, the tiles and outlines are sent as separate layers: a
+    new map style only swaps the tile layer in the browser instead of redrawing the map.
+    """
+    with span("folium.st_folium"):
+        return st_folium(
+            overview_base_map(),
+            key="overview_map",
+            use_container_width=True,
+            feature_group_to_add=overview_layers(map_style, tile_url),
+            returned_objects=[],
+        )
+
+@timed()
+def build_overview_map(map_style, tile_url=None):
+    """
+    The map shown by overview_map, with its layers added.
+    """
+    m = overview_base_map()
+    for layer in overview_layers(map_style, tile_url):
+        layer.add_to(m)
+    return m
+
+def site_features(glacier_sites):
+    """
+    GeoJSON FeatureCollection of the study sites, colored by region.
+    """
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                "properties": {"name": name, "site": site, "color": REGION_COLORS.get(region, "red")},
+            }
+            for lon, lat, name, site, region in zip(
+                glacier_sites["LON"], glacier_sites["LAT"], glacier_sites["Official_n"],
+                glacier_sites["Glacier_ID"], glacier_sites["Region"],
+            )
+        ],
+    }
+
+def overview_base_map():
+    """
+    Greenland outline (cached, simplified GeoJSON) and the study sites as one GeoJson
+    layer, without tiles.
+    """
+    m = folium.Map(location=[72, -40], zoom_start=4, tiles=None)
+
+    # Main Greenland shapefile customization:
+    folium.GeoJson(
+        load_greenland_outline(),
+        name="Greenland",
+        style_function=lambda x: {"fillColor": "#3156de", "color": "black", "weight": 1.0},
+    ).add_to(m)
+
+    # Add markers to signify study sites:
+    folium.GeoJson(
+        site_features(load_glacier_sites()),
+        name="Study sites",
+        marker=folium.CircleMarker(radius=7, fill=True, fill_opacity=0.9, weight=1),
+        style_function=lambda feature: {"fillColor": feature["properties"]["color"], "color": "black"},
+        popup=folium.GeoJsonPopup(fields=["name"], aliases=["Official Name:"]),
+        tooltip=folium.GeoJsonTooltip(fields=["site"], aliases=["Site:"]),
+    ).add_to(m)
+    return m
+
+def overview_layers(map_style, tile_url=None):
+    """
+    The layers of the overview map that follow the sidebar: the tile layer of map_style
+    and, with tile_url, the vector tiles of every iceberg outline.
+    """
+    tiles = folium.FeatureGroup(name=map_style)
+    folium.TileLayer(map_style).add_to(tiles)
+    layers = [tiles]
+
+    if tile_url:
+        outlines = folium.FeatureGroup(name="Iceberg outlines")
+        add_vector_tile_layer(outlines, tile_url)
+        layers.append(outlines)
+    return layers
+
+def get_available_dates(site_id):
+    """
+    Get available date ranges based on site ID
+    """
+    from .catalog import catalog_date_pairs, load_catalog
+
+    return catalog_date_pairs(load_catalog(), site_id)
+
+def iceberg_features(icebergs, early_date, later_date, zoom=None):
+    """
+    One GeoJSON-ready row per iceberg (EPSG:4326 outline) carrying the properties the map
+    styles and pops up: id, date, width, height and color. With a map zoom level, the
+    outlines are simplified to that zoom (see modules.simplify).
+    """
+    import geopandas as gpd
+
+    from .simplify import select_tolerance, simplified_geometry, zoom_meters_per_pixel
+
+    geometry = icebergs["geometry_4326"]
+    if zoom is not None:
+        meters_per_pixel = zoom_meters_per_pixel(zoom, icebergs["centroid_lat"].mean())
+        if select_tolerance(meters_per_pixel) is not None:
+            geometry = simplified_geometry(icebergs, meters_per_pixel).to_crs("EPSG:4326")
+
+    names = icebergs["shapefile"]
+    is_early = names.str.contains(early_date, regex=False)
+    is_later = names.str.contains(later_date, regex=False)
+
+    return gpd.GeoDataFrame(
+        {
+            "id": names,
+            "date": np.select([is_early, is_later], [early_date, later_date], ""),
+            # Width and height were measured in EPSG:3413 (meters) when the catalog was built
+            "width": icebergs["width"].round(2),
+            "height": icebergs["height"].round(2),
+            "color": np.select([is_early, is_later], ["#7a1037", "#033b59"], "gray"),
+        },
+        geometry=geometry,
+    )
+
+def viewport_bounds(lat, lon, zoom, width=800, height=600):
+    """
+    (west, south, east, north) in degrees seen by a web map of width x height pixels
+    centered on lat/lon at a zoom level.
+    """
+    degrees_per_pixel = 360 / (256 * 2 ** zoom)
+    y = math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+    half_height = math.radians(degrees_per_pixel * height / 2)
+    south = math.degrees(2 * math.atan(math.exp(y - half_height)) - math.pi / 2)
+    north = math.degrees(2 * math.atan(math.exp(y + half_height)) - math.pi / 2)
+    half_width = degrees_per_pixel * width / 2
+    return lon - half_width, south, lon + half_width, north
+
+def folium_bounds(bounds):
+    """
+    (west, south, east, north) of the bounds returned by st_folium, or None before the
+    map has reported them.
+    """
+    try:
+        south_west, north_east = bounds["_southWest"], bounds["_northEast"]
+        return south_west["lng"], south_west["lat"], north_east["lng"], north_east["lat"]
+    except (KeyError, TypeError):
+        return None
+
+def icebergs_in_view(site_id, early_date, later_date, bounds, shapefiles=None, margin=0.25):
+    """
+    Catalog rows of the date pair intersecting bounds (west, south, east, north), grown by
+    `margin` of its size on every side so that short pans are already covered. With
+    shapefiles, only those icebergs are considered.
+    """
+    from .spatial_index import load_spatial_index
+
+    west, south, east, north = bounds
+    dx, dy = (east - west) * margin, (north - south) * margin
+    return load_spatial_index().query_bounds(
+        west - dx, max(south - dy, -85), east + dx, min(north + dy, 85), crs="EPSG:4326",
+        site=site_id, date_pair=f"{early_date}-{later_date}", shapefiles=shapefiles,
+    ).reset_index(drop=True)
+
+def iceberg_base_map(glacier_sites, site_id, location=None, zoom_start=12.3, tile_url=None):
+    """
+    The map of iceberg_map without icebergs, centered on the site or on `location`.
+    """
+    site = glacier_sites[glacier_sites['Glacier_ID'] == site_id]
+    if location is None:
+        location = [site.iloc[0]['LAT'], site.iloc[0]['LON']]
+
+    m = folium.Map(
+        location=location,
+        zoom_start=zoom_start,
+        tiles="CartoDB positron"
+    )
+
+    if tile_url:
+        add_vector_tile_layer(m, tile_url, color="gray")
+    return m
+
+def iceberg_layer(icebergs, early_date, later_date, name, zoom=None):
+    """
+    FeatureGroup with every iceberg in a single GeoJson layer styled and popped up from
+    its feature properties.
+    """
+    group = folium.FeatureGroup(name=name)
+    if icebergs.empty:
+        return group
+
+    folium.GeoJson(
+        iceberg_features(icebergs, early_date, later_date, zoom=zoom),
+        name=name,
+        style_function=lambda feature: {"color": feature["properties"]["color"], "weight": 1},
+        popup=folium.GeoJsonPopup(
+            fields=["id", "width", "height"],
+            aliases=["Iceberg ID:", "Width (m):", "Height (m):"],
+            max_width=300,
+        ),
+        tooltip=folium.GeoJsonTooltip(fields=["id", "date"], aliases=["Iceberg ID:", "Date:"]),
+    ).add_to(group)
+    return group
+
+def drift_layer(drift, name="Drift"):
+    """
+    FeatureGroup with one line per matched iceberg (see modules.drift), from its early to
+    its later centroid, in a single GeoJson layer.
+    """
+    import geopandas as gpd
+    import shapely
+
+    group = folium.FeatureGroup(name=name)
+    if drift.empty:
+        return group
+
+    lines = shapely.linestrings(
+        np.stack([drift[["early_lon", "early_lat"]].to_numpy(), drift[["later_lon", "later_lat"]].to_numpy()], axis=1)
+    )
+    features = gpd.GeoDataFrame(
+        {
+            "early": drift["early_shapefile"],
+            "later": drift["later_shapefile"],
+            "distance": drift["distance"].round(1),
+            "rotation": drift["rotation"].round(1),
+        },
+        geometry=lines,
+        crs="EPSG:4326",
+    )
+    folium.GeoJson(
+        features,
+        name=name,
+        style_function=lambda feature: {"color": "#e65100", "weight": 2},
+        tooltip=folium.GeoJsonTooltip(
+            fields=["early", "later", "distance", "rotation"],
+            aliases=["Early iceberg:", "Later iceberg:", "Drift (m):", "Rotation (°):"],
+        ),
+    ).add_to(group)
+    return group
+
+@cached_file_loader
+@timed("maps.density_overlay")
+def read_density_overlay(source_path, statistic, resolution, region, year, site, log):
+    # Resampled to Web Mercator, colorized and PNG-encoded once per raster and source file
+    from folium.utilities import image_to_url
+
+    from .density import colorize, density_grid, to_web_mercator
+
+    density = density_grid(statistic, resolution, region, year, site)
+    if density is None:
+        return None
+    values, bounds = to_web_mercator(density)
+    return image_to_url(colorize(values, log=log)), bounds
+
+def density_layer(statistic="count", resolution=1000, region=None, year=None, site=None, name="Iceberg density",
+                  log=False, opacity=0.7):
+    """
+    FeatureGroup with the raster of density.density_grid as one image overlay, resampled
+    to Web Mercator. The image is cached until the catalog (or melt store) changes, so
+    reruns of the map, e.g. on every pan or zoom, only send it again.
+    """
+    from .density import density_grid
+
+    group = folium.FeatureGroup(name=name)
+    # Brings the catalog or melt store up to date first, the overlay is keyed on that file
+    if density_grid(statistic, resolution, region, year, site) is None:
+        return group
+    source = MELT_STORE_PATH if statistic == "melt_rate" else CATALOG_INDEX_PATH
+    url, bounds = read_density_overlay(source, statistic, resolution, region, year, site, log)
+    folium.raster_layers.ImageOverlay(url, bounds=bounds, opacity=opacity, mercator_project=False, name=name).add_to(group)
+    return group
+
+@timed()
+def iceberg_map(glacier_sites, site_id, early_date, later_date, single_layer=True, tile_url=None, bounds=None):
+    """
+    Interactive map with icebergs. By default every iceberg of the date pair goes into a
+    single GeoJson layer styled and popped up from its feature properties; pass
+    single_layer=False to get one layer per iceberg instead. With tile_url (see
+    modules.tiles) the outlines of the whole catalog are drawn underneath as vector tiles.
+    With bounds (west, south, east, north in degrees) only the icebergs in that extent are
+    loaded, through the spatial index, and the map is fitted to it.
+    """
+    from .catalog import catalog_icebergs, load_catalog
+
+    zoom_start = 12.3
+    m = iceberg_base_map(glacier_sites, site_id, zoom_start=zoom_start, tile_url=tile_url)
+
+    # Add icebergs of the date pair to the map, straight from the catalog index
+    if bounds is None:
+        icebergs = catalog_icebergs(load_catalog(), site_id, f"{early_date}-{later_date}")
+    else:
+        west, south, east, north = bounds
+        m.fit_bounds([[south, west], [north, east]])
+        icebergs = icebergs_in_view(site_id, early_date, later_date, bounds, margin=0)
+    if icebergs.empty:
+        return m
+
+    if single_layer:
+        iceberg_layer(icebergs, early_date, later_date, f"{site_id} {early_date}-{later_date}", zoom_start).add_to(m)
+    else:
+        features = iceberg_features(icebergs, early_date, later_date, zoom=zoom_start)
+        for i, iceberg in enumerate(features.itertuples()):
+            popup_content = f"<strong>Iceberg ID:</strong> {iceberg.id}<br><strong>Width:</strong> {iceberg.width} meters<br><strong>Height:</strong> {iceberg.height} meters"
+
+            # Add GeoJson to map with popups
+            folium.GeoJson(
+                features.iloc[[i]][["geometry"]].__geo_interface__,
+                name=iceberg.id,
+                style_function=lambda x, color=iceberg.color: {"color": color, "weight": 1},
+                popup=folium.Popup(popup_content, max_width=300)
+            ).add_to(m)
+
+    # Zoom into iceberg centroid
+    if bounds is None:
+        m.location = [icebergs["centroid_lat"].iloc[-1], icebergs["centroid_lon"].iloc[-1]]
+        m.zoom_start = 12
+
+    return m
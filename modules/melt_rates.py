@@ -0,0 +1,90 @@
+"""
+Streaming readers for the melt-rate tables.
+
+The dashboard needs only a preview of a table and the correlation matrix of its melt
+columns, so the table is never held in memory as a whole: the correlation is
+accumulated chunk by chunk from running sums (n, sum x, sum x², sum xy), reading only
+the correlated columns as float64. Memory is bounded by MELT_CHUNK_ROWS whatever the
+size of the table.
+"""
+import numpy as np
+import pandas as pd
+
+from .instrumentation import timed
+
+# Position, timing and density columns, left out of the correlogram
+UNWANTED_MELT_COLUMNS = [
+    'X_i', 'Y_i', 'TimeSeparation', 'VerticalAdjustment_i', 'VerticalAdjustment_f', 'Density_i', 'Density_f',
+]
+
+MELT_CHUNK_ROWS = 100_000
+MELT_PREVIEW_ROWS = 1_000
+
+
+def melt_columns(csv_file_path):
+    """
+    Column names of a melt-rate table, from its header only.
+    """
+    return list(pd.read_csv(csv_file_path, nrows=0).columns)
+
+
+def correlation_columns(csv_file_path):
+    return [column for column in melt_columns(csv_file_path) if column not in UNWANTED_MELT_COLUMNS]
+
+
+def iter_melt_chunks(csv_file_path, columns=None, chunksize=MELT_CHUNK_ROWS):
+    """
+    Chunks of the table with only `columns` parsed, as float64.
+    """
+    columns = columns if columns is not None else correlation_columns(csv_file_path)
+    return pd.read_csv(
+        csv_file_path, usecols=columns, dtype={column: np.float64 for column in columns}, chunksize=chunksize,
+    )
+
+
+@timed("melt_rates.statistics")
+def melt_statistics(csv_file_path, chunksize=MELT_CHUNK_ROWS):
+    """
+    Number of rows and pairwise Pearson correlation of the correlogram columns (same as
+    DataFrame.corr(): missing values are excluded pair by pair), in one streaming pass.
+    """
+    columns = correlation_columns(csv_file_path)
+    k = len(columns)
+    n = np.zeros((k, k))
+    sum_x = np.zeros((k, k))  # sum_x[i, j]: sum of column i over rows where j is also present
+    sum_xx = np.zeros((k, k))
+    sum_xy = np.zeros((k, k))
+    shift = None
+    rows = 0
+
+    for chunk in iter_melt_chunks(csv_file_path, columns, chunksize):
+        values = chunk[columns].to_numpy()
+        rows += len(values)
+        present = ~np.isnan(values)
+        if shift is None:
+            # Shift by a rough mean to keep the running sums from cancelling out
+            with np.errstate(invalid="ignore"):
+                shift = np.nan_to_num(np.nanmean(values, axis=0)) if len(values) else np.zeros(k)
+        centered = np.where(present, values - shift, 0.0)
+        weights = present.astype(np.float64)
+
+        n += weights.T @ weights
+        sum_x += centered.T @ weights
+        sum_xx += (centered ** 2).T @ weights
+        sum_xy += centered.T @ centered
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        covariance = n * sum_xy - sum_x * sum_x.T
+        variance = (n * sum_xx - sum_x ** 2) * (n * sum_xx - sum_x ** 2).T
+        corr = covariance / np.sqrt(variance)
+    corr[n < 2] = np.nan
+    np.fill_diagonal(corr, np.where(np.diag(n) >= 2, 1.0, np.nan))
+
+    return {"rows": rows, "corr": pd.DataFrame(np.clip(corr, -1, 1), index=columns, columns=columns)}
+
+
+def melt_preview(csv_file_path, nrows=MELT_PREVIEW_ROWS):
+    """
+    The first `nrows` rows of the table, every column.
+    """
+    return pd.read_csv(csv_file_path, nrows=nrows)
@@ -0,0 +1,235 @@
+"""
+Consolidated melt-rate store and cross-site aggregations.
+
+All melt-rate tables under MELT_RATES_DIR are gathered once into a single Parquet
+file (MELT_STORE_PATH), one row per iceberg, with the site, date pair, region
+(from Glacier-Locations.csv), year and season of its table. Refreshing only re-reads the
+tables whose mtime/size changed, like the catalog index.
+
+Group-by summaries and per-group correlation matrices are computed from the loaded store
+and cached (modules.cache) until the store file changes, so a query over every site is a
+dictionary lookup after its first call.
+
+Build or refresh the store with:
+
+    python -m modules.melt_store
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from .cache import atomic_path, cached_file_loader, file_cache
+from .data_path import GLACIER_LOCATIONS_CSV, MELT_RATES_DIR, MELT_STORE_PATH
+from .instrumentation import timed
+from .loaders import load_glacier_sites
+from .melt_rates import UNWANTED_MELT_COLUMNS
+
+MELT_SUFFIX = "_iceberg_meltinfo.csv"
+FILE_COLUMNS = ["site", "date_pair", "early_date", "later_date", "path", "mtime", "size"]
+
+# Columns queries can group and filter by
+GROUP_COLUMNS = ["site", "region", "year", "season"]
+
+SEASONS = {
+    12: "Winter", 1: "Winter", 2: "Winter",
+    3: "Spring", 4: "Spring", 5: "Spring",
+    6: "Summer", 7: "Summer", 8: "Summer",
+    9: "Autumn", 10: "Autumn", 11: "Autumn",
+}
+
+SUMMARY_STATISTICS = ["count", "mean", "std", "min", "median", "max"]
+
+
+def scan_melt_rates(melt_dir=MELT_RATES_DIR):
+    """
+    Walk <melt_dir>/<site>/<early>-<later>/*_iceberg_meltinfo.csv, one row per table.
+    """
+    rows = []
+    if not os.path.exists(melt_dir):
+        return pd.DataFrame(columns=FILE_COLUMNS)
+
+    for site in sorted(os.scandir(melt_dir), key=lambda entry: entry.name):
+        if not site.is_dir():
+            continue
+        for date_pair in sorted(os.scandir(site.path), key=lambda entry: entry.name):
+            if not date_pair.is_dir() or '-' not in date_pair.name:
+                continue
+            early_date, later_date = date_pair.name.split('-')[:2]
+            for entry in sorted(os.scandir(date_pair.path), key=lambda entry: entry.name):
+                if not entry.name.endswith(MELT_SUFFIX):
+                    continue
+                stat = entry.stat()
+                rows.append({
+                    "site": site.name,
+                    "date_pair": date_pair.name,
+                    "early_date": early_date,
+                    "later_date": later_date,
+                    "path": entry.path,
+                    "mtime": stat.st_mtime_ns,
+                    "size": stat.st_size,
+                })
+
+    return pd.DataFrame(rows, columns=FILE_COLUMNS)
+
+
+def read_melt_table(table):
+    """
+    Rows of one melt-rate table (a row of scan_melt_rates), tagged with its file.
+    """
+    df = pd.read_csv(table.path)
+    for column in FILE_COLUMNS:
+        df[column] = getattr(table, column)
+    return df
+
+
+def add_group_columns(store, glacier_sites):
+    """
+    (Re)derive region, year and season of every row. The season is that of the early date.
+    """
+    regions = glacier_sites.drop_duplicates("Glacier_ID").set_index("Glacier_ID")["Region"]
+    store["region"] = store["site"].map(regions).fillna("Unknown")
+    early = pd.to_datetime(store["early_date"], format="%Y%m%d", errors="coerce")
+    store["year"] = early.dt.year.astype("Int64")
+    store["season"] = early.dt.month.map(SEASONS).fillna("Unknown")
+    return store
+
+
+@timed("melt_store.build")
+def build_melt_store(melt_dir=MELT_RATES_DIR, store_path=MELT_STORE_PATH, full=False):
+    """
+    Build the store, or refresh it: unchanged tables are kept, changed and new ones are
+    re-read and deleted ones dropped. Regions are always re-joined, so an edited
+    Glacier-Locations.csv takes effect on the next refresh.
+
+    Returns the store and a dict with the number of kept, read and removed tables.
+    """
+    tables = scan_melt_rates(melt_dir)
+
+    kept, stale, removed = None, tables, 0
+    if not full and os.path.exists(store_path):
+        existing = read_melt_store(store_path)
+        indexed = existing[["path", "mtime", "size"]].drop_duplicates()
+        merged = tables.merge(indexed, on="path", how="left", suffixes=("", "_stored"))
+        unchanged = ((merged["mtime"] == merged["mtime_stored"]) & (merged["size"] == merged["size_stored"])).to_numpy()
+        kept = existing[existing["path"].isin(tables.loc[unchanged, "path"])]
+        stale = tables.loc[~unchanged]
+        removed = len(set(indexed["path"]) - set(tables["path"]))
+
+    frames = [read_melt_table(table) for table in stale.itertuples(index=False)]
+    if kept is not None and not kept.empty:
+        frames.insert(0, kept)
+    frames = [frame for frame in frames if not frame.empty]
+    store = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=FILE_COLUMNS)
+
+    if os.path.exists(GLACIER_LOCATIONS_CSV):
+        glacier_sites = load_glacier_sites()
+    else:
+        glacier_sites = pd.DataFrame(columns=["Glacier_ID", "Region"])
+    store = add_group_columns(store, glacier_sites)
+    store = store.sort_values(["site", "date_pair"], kind="stable").reset_index(drop=True)
+
+    write_melt_store(store, store_path)
+    summary = {
+        "kept": 0 if kept is None else kept["path"].nunique(),
+        "read": len(stale),
+        "removed": removed,
+    }
+    return store, summary
+
+
+def write_melt_store(store, store_path=MELT_STORE_PATH):
+    # Write next to the target and swap it in, so readers never see a half-written file
+    with atomic_path(store_path) as tmp_path:
+        store.to_parquet(tmp_path, index=False)
+
+
+def read_melt_store(store_path=MELT_STORE_PATH):
+    return pd.read_parquet(store_path)
+
+
+def load_melt_store(store_path=MELT_STORE_PATH):
+    """
+    Return the store, building it first if it does not exist yet.
+    """
+    if not os.path.exists(store_path):
+        build_melt_store(store_path=store_path)
+    return file_cache.load(read_melt_store, store_path)
+
+
+def melt_value_columns(store):
+    """
+    Numeric melt columns that summaries and correlations are computed over.
+    """
+    excluded = set(UNWANTED_MELT_COLUMNS + FILE_COLUMNS + GROUP_COLUMNS)
+    return [
+        column for column in store.columns
+        if column not in excluded and pd.api.types.is_numeric_dtype(store[column])
+    ]
+
+
+def filter_store(store, **filters):
+    """
+    Rows whose group columns are in the given values, e.g. filter_store(store, region=["NW"]).
+    Empty or None filters are ignored.
+    """
+    mask = np.ones(len(store), dtype=bool)
+    for column, values in filters.items():
+        if values:
+            mask &= store[column].isin(values).to_numpy()
+    return store[mask]
+
+
+@cached_file_loader
+@timed("melt_store.summary")
+def read_group_summary(store_path, by):
+    store = load_melt_store(store_path)
+    return store.groupby(list(by), observed=True)[melt_value_columns(store)].agg(SUMMARY_STATISTICS)
+
+
+@cached_file_loader
+@timed("melt_store.correlations")
+def read_group_correlations(store_path, by):
+    store = load_melt_store(store_path)
+    columns = melt_value_columns(store)
+    return {
+        group if isinstance(group, tuple) else (group,): rows[columns].corr()
+        for group, rows in store.groupby(list(by), observed=True)
+    }
+
+
+def group_summary(by, store_path=MELT_STORE_PATH):
+    """
+    count/mean/std/min/median/max of every melt column per group, `by` being a list of
+    GROUP_COLUMNS. Cached until the store changes.
+    """
+    load_melt_store(store_path)
+    return read_group_summary(store_path, tuple(by))
+
+
+def group_correlations(by, store_path=MELT_STORE_PATH):
+    """
+    {group key tuple: correlation matrix of the melt columns} per group of `by`.
+    Cached until the store changes.
+    """
+    load_melt_store(store_path)
+    return read_group_correlations(store_path, tuple(by))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or refresh the consolidated melt-rate store.")
+    parser.add_argument("--melt-dir", default=MELT_RATES_DIR)
+    parser.add_argument("--store", default=MELT_STORE_PATH)
+    parser.add_argument("--full", action="store_true", help="Re-read every melt-rate table.")
+    args = parser.parse_args()
+
+    store, summary = build_melt_store(args.melt_dir, args.store, full=args.full)
+    print(
+        f"{len(store)} icebergs from {store['path'].nunique()} tables in {args.store} "
+        f"({summary['read']} read, {summary['kept']} unchanged, {summary['removed']} removed)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Vectorized shape metrics for whole arrays of iceberg outlines.
+
+Everything here works on a GeoSeries (or any array of shapely geometries) at once using
+shapely 2 array functions and NumPy coordinate arrays, so there are no per-geometry
+Python calls. Lengths and areas are in the units of the input CRS, so pass outlines in
+EPSG:3413 to get meters.
+"""
+import numpy as np
+import pandas as pd
+import shapely
+
+from .instrumentation import timed
+
+
+def _as_array(geometries):
+    return np.asarray(getattr(geometries, "values", geometries), dtype=object)
+
+
+def normalize_to_origin(geometries):
+    """
+    Translate every geometry so its bounding box starts at (0, 0).
+    Returns a NumPy array of shapely geometries in the input order.
+    """
+    geometries = _as_array(geometries)
+    _, index = shapely.get_coordinates(geometries, return_index=True)
+    offsets = shapely.bounds(geometries)[:, :2][index]
+    return shapely.transform(geometries, lambda coords: coords - offsets)
+
+
+def rotated_rectangle_axes(rectangles):
+    """
+    Long axis, short axis and dominant angle (degrees, of the longest edge) for an array
+    of minimum rotated rectangles. Degenerate rectangles of collinear outlines come back
+    from shapely as lines or points and are measured along the line.
+    """
+    rectangles = _as_array(rectangles)
+    n = len(rectangles)
+    long_axis = np.zeros(n)
+    short_axis = np.zeros(n)
+    angle = np.full(n, np.nan)
+
+    type_id = np.where(shapely.is_empty(rectangles), -1, shapely.get_type_id(rectangles))
+
+    is_polygon = type_id == shapely.GeometryType.POLYGON
+    if is_polygon.any():
+        # A rectangle ring always has five coordinates (the first one repeated)
+        rings = shapely.get_exterior_ring(rectangles[is_polygon])
+        coords = shapely.get_coordinates(rings).reshape(-1, 5, 2)
+        edges = np.diff(coords, axis=1)[:, :3]
+        lengths = np.linalg.norm(edges, axis=2)
+        longest = edges[np.arange(len(edges)), np.argmax(lengths, axis=1)]
+
+        long_axis[is_polygon] = lengths[:, :2].max(axis=1)
+        short_axis[is_polygon] = lengths[:, :2].min(axis=1)
+        angle[is_polygon] = np.degrees(np.arctan2(longest[:, 1], longest[:, 0]))
+
+    is_line = type_id == shapely.GeometryType.LINESTRING
+    if is_line.any():
+        lines = rectangles[is_line]
+        start = shapely.get_coordinates(shapely.get_point(lines, 0))
+        end = shapely.get_coordinates(shapely.get_point(lines, -1))
+        edge = end - start
+        long_axis[is_line] = np.linalg.norm(edge, axis=1)
+        angle[is_line] = np.degrees(np.arctan2(edge[:, 1], edge[:, 0]))
+
+    return long_axis, short_axis, angle
+
+
+@timed("metrics.geometry")
+def geometry_metrics(geometries):
+    """
+    Area, perimeter, bounds, minimum-rotated-rectangle axes, aspect ratio and dominant
+    angle for every geometry, as a DataFrame aligned with the input.
+    """
+    index = getattr(geometries, "index", None)
+    geometries = _as_array(geometries)
+
+    bounds = shapely.bounds(geometries)
+    rectangles = shapely.minimum_rotated_rectangle(geometries)
+    long_axis, short_axis, angle = rotated_rectangle_axes(rectangles)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        aspect_ratio = np.where(short_axis > 0, long_axis / short_axis, np.nan)
+
+    return pd.DataFrame(
+        {
+            "area": shapely.area(geometries),
+            "perimeter": shapely.length(geometries),
+            "minx": bounds[:, 0],
+            "miny": bounds[:, 1],
+            "maxx": bounds[:, 2],
+            "maxy": bounds[:, 3],
+            "width": bounds[:, 2] - bounds[:, 0],
+            "height": bounds[:, 3] - bounds[:, 1],
+            "long_axis": long_axis,
+            "short_axis": short_axis,
+            "aspect_ratio": aspect_ratio,
+            "dominant_angle": angle,
+        },
+        index=index,
+    )
@@ -1,23 +1,25 @@
-import os
+import math
 
-import folium
 import geopandas as gpd
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from shapely.affinity import translate
-from streamlit_folium import st_folium
+import shapely
 
-from .data_path import (
-    GLACIER_LOCATIONS_CSV,
-    HISTO_CSV_FILE_PATH,
-    NATURAL_EARTH_PATH,
-    SHAPEFILE_CATALOG_DIR,
-)
+from .instrumentation import timed
+from .loaders import load_date_pairings
+from .melt_rates import UNWANTED_MELT_COLUMNS
+from .metrics import geometry_metrics, normalize_to_origin
+from .simplify import figure_meters_per_pixel, select_tolerance, simplified_column, simplified_geometry
 
+# matplotlib and seaborn are imported inside the drawing functions: figures are usually
+# served from modules.figure_cache, so most page runs never need them.
 
+
+@timed()
 def distribution_plot():
-    df = pd.read_csv(HISTO_CSV_FILE_PATH)
+    import matplotlib.pyplot as plt
+
+    df = load_date_pairings()
 
     df_sorted = df.sort_values(by='Corresponding icebergs', ascending=True)
     names = df_sorted['Official_n'].astype(str)
@@ -38,119 +40,236 @@ def distribution_plot():
 
     return plt
 
-def overview_map(map_style):
-    glacier_sites = pd.read_csv(GLACIER_LOCATIONS_CSV)
-    world = gpd.read_file(NATURAL_EARTH_PATH)
-    greenland = world[world['NAME'] == 'Greenland']
-
-    # This will convert Greenland to GeoJSON for Folium package:
-    greenland_geojson = greenland.to_crs("EPSG:4326").__geo_interface__
-    map = folium.Map(location=[72, -40], zoom_start=4, tiles=map_style)
-
-    # Main Greenland shapefile customization:
-    folium.GeoJson(
-        greenland_geojson,
-        name="Greenland",
-        style_function=lambda x: {"fillColor": "#3156de", "color": "black", "weight": 1.0},
-    ).add_to(map)
-
-    # Sorts sites into regional categories:
-    region_colors = {
-        'SE': 'red',
-        'CE': 'orange',
-        'CW': 'yellow',
-        'NW': 'green',
-        'NE': 'lime',
-        'NO': 'blue',
-        'SW': 'purple'
-    }
-
-    # Add markers to signify study sites:
-    for _, site in glacier_sites.iterrows():
-        region = site['Region']
-        color = region_colors.get(region, 'red')
-
-        folium.Marker(
-            location=[site['LAT'], site['LON']],
-            popup=f"Official Name: {site['Official_n']}",
-            icon=folium.Icon(color=color, icon="info-sign"),
-        ).add_to(map)
-
-    return st_folium(map, use_container_width=True)
-
+@timed()
 def calculate_dominant_angle(gdf):
     """
     This function will calculate the dominant angle of the iceberg shapes, so that they
     plot a little nicer and more uniform. It will use the average dominant angle.
     """
     gdf = gdf[gdf['geometry'].is_valid]  # Ensure geometry is valid
-    bounds = gdf['geometry'].apply(lambda geom: geom.minimum_rotated_rectangle)
-
-    def longest_edge_angle(box):
-        coords = np.array(box.exterior.coords)
-        edges = np.diff(coords, axis=0)[:-1]
-        lengths = np.linalg.norm(edges, axis=1)
-        longest_idx = np.argmax(lengths)
-        longest_edge = edges[longest_idx]
-        angle = np.arctan2(longest_edge[1], longest_edge[0])
-        return np.degrees(angle)
-
-    angles = bounds.apply(longest_edge_angle)
-    return angles.mean()
+    return geometry_metrics(gdf['geometry'])['dominant_angle'].mean()
 
 quartile_colors = {"Q1": "#8bd67a", "Q2": "#e080d7", "Q3": "#f7bf07", "Q4": "#f78307"}
 quartile_opacity = {"Q1": 0.4, "Q2": 0.4, "Q3": 0.4, "Q4": 0.4}
 
-def iceberg_quartiles(area_df, target_folder):
+@timed()
+def assign_quartiles(icebergs, panel_inches=None, dpi=100):
+    """
+    One pass over already-projected icebergs (a GeoDataFrame in EPSG:3413, e.g. one date pair
+    from the catalog): computes area, width and height, sorts each iceberg into an area quartile
+    and translates its outline to the origin so all shapes can share the same axes.
+
+    With panel_inches, the outlines are taken from the catalog's simplified geometries at the
+    resolution of a panel of that size rendered at `dpi` (see modules.simplify); metrics always
+    use full outlines.
+    """
+    geometry = icebergs.geometry
+    metrics = geometry_metrics(geometry)
+    if panel_inches:
+        extent = max(metrics["width"].max(), metrics["height"].max())
+        geometry = simplified_geometry(icebergs, figure_meters_per_pixel(extent, panel_inches, dpi))
+
+    quartiles = gpd.GeoDataFrame(
+        {
+            "shapefile": icebergs["shapefile"].to_numpy(),
+            "area": metrics["area"].to_numpy(),
+            "width": metrics["width"].to_numpy(),
+            "height": metrics["height"].to_numpy(),
+        },
+        geometry=normalize_to_origin(geometry),
+        crs=geometry.crs,
+    )
+    # Ranking first splits icebergs that share an area. Quartiles follow the edges pd.qcut
+    # puts on the ranks, without its error on date pairs of a single iceberg (all in Q1).
+    rank = quartiles["area"].rank(method="first").to_numpy()
+    codes = np.clip(np.ceil(4 * (rank - 1) / max(len(rank) - 1, 1)) - 1, 0, 3).astype(int)
+    quartiles["quartile"] = pd.Categorical.from_codes(codes, categories=["Q1", "Q2", "Q3", "Q4"], ordered=True)
+    return quartiles
+
+def quartile_levels(icebergs, panel_inches=None, dpi=100):
+    """
+    Geometry columns assign_quartiles reads for these catalog rows: the full outline, and
+    the simplification matching panel_inches. Only the width and height columns are used,
+    so the outlines can be loaded afterwards (see geometry_store.GeometryStore.icebergs).
+    """
+    levels = ["geometry"]
+    if panel_inches and len(icebergs):
+        extent = max(icebergs["width"].max(), icebergs["height"].max())
+        tolerance = select_tolerance(figure_meters_per_pixel(extent, panel_inches, dpi))
+        if tolerance is not None:
+            levels.append(simplified_column(tolerance))
+    return levels
+
+@timed()
+def iceberg_quartiles(icebergs, panel_inches=6):
+    """
+    Plot icebergs in four subplots of about panel_inches each, one per area quartile. Takes the
+    output of assign_quartiles, or any GeoDataFrame of icebergs in EPSG:3413, so nothing is read
+    from disk here.
+    """
+    import matplotlib.pyplot as plt
+
+    if "quartile" not in icebergs.columns:
+        icebergs = assign_quartiles(icebergs)
+
     # This will help with consistent scaling:
-    max_width, max_height = 0, 0
-    for shapefile in area_df["Shapefile"]:
-        shapefile_path = os.path.join(target_folder, shapefile)
-        gdf = gpd.read_file(shapefile_path)
-
-        if gdf.crs is None:
-            gdf = gdf.set_crs("EPSG:3413")
-        gdf = gdf.to_crs("EPSG:3413")
-
-        if not gdf.empty:
-            bounds = gdf.total_bounds
-            max_width = max(max_width, bounds[2] - bounds[0])
-            max_height = max(max_height, bounds[3] - bounds[1])
-    
-    fig, axes = plt.subplots(2, 2, figsize=(12, 12), sharex=True, sharey=True)
+    max_width, max_height = icebergs["width"].max(), icebergs["height"].max()
+
+    fig, axes = plt.subplots(2, 2, figsize=(2 * panel_inches, 2 * panel_inches), sharex=True, sharey=True)
     axes = axes.flatten()
 
     for i, quartile in enumerate(["Q1", "Q2", "Q3", "Q4"]):
         ax = axes[i]
         ax.set_title(f"Quartile {quartile}", fontsize=10)
 
-        quartile_files = area_df[area_df["Quartile"] == quartile]["Shapefile"]
+        quartile_icebergs = icebergs[icebergs["quartile"] == quartile]
+        if not quartile_icebergs.empty:
+            color = quartile_colors[quartile]
+            opacity = quartile_opacity[quartile]
+            quartile_icebergs.plot(ax=ax, color=color, edgecolor="black", alpha=opacity, linewidth=2)
 
-        for shapefile in quartile_files:
-            shapefile_path = os.path.join(target_folder, shapefile)
-            gdf = gpd.read_file(shapefile_path)
+        ax.set_xlim(0, max_width)
+        ax.set_ylim(0, max_height)
+        ax.set_xlabel("Width (m)")
+        ax.set_ylabel("Height (m)")
 
-            if gdf.crs is None:
-                gdf = gdf.set_crs(
-                    "EPSG:3413"
-                )  # Proper projection for Greenland; this value will change depending on where your data is!
-            gdf = gdf.to_crs("EPSG:3413")
+    return fig
 
-            color = quartile_colors[quartile]
-            opacity = quartile_opacity[quartile]
+def outline_paths(geometries):
+    """
+    One matplotlib Path per (multi)polygon, holes included, built from a single coordinate
+    array for all geometries instead of one shapely call per ring.
+    """
+    from matplotlib.path import Path
+
+    geometries = np.asarray(getattr(geometries, "values", geometries), dtype=object)
+    parts, part_index = shapely.get_parts(geometries, return_index=True)
+    rings, ring_index = shapely.get_rings(parts, return_index=True)
+    coords, coord_index = shapely.get_coordinates(rings, return_index=True)
 
-            overall_bounds = gdf.total_bounds
-            gdf["geometry"] = gdf["geometry"].apply(
-                lambda geom: translate(geom, -overall_bounds[0], -overall_bounds[1])
-            )
+    # Every ring starts with MOVETO and ends with CLOSEPOLY
+    codes = np.full(len(coords), Path.LINETO, dtype=Path.code_type)
+    ring_starts = np.flatnonzero(np.diff(coord_index, prepend=-1))
+    codes[ring_starts] = Path.MOVETO
+    codes[np.append(ring_starts[1:], len(coords)) - 1] = Path.CLOSEPOLY
 
-            gdf.plot(ax=ax, color=color, edgecolor="black", alpha=opacity, linewidth=2)
+    geometry_index = part_index[ring_index][coord_index]
+    splits = np.searchsorted(geometry_index, np.arange(1, len(geometries)))
+    return [Path(v, c) for v, c in zip(np.split(coords, splits), np.split(codes, splits))]
+
+early_color, later_color = '#f5a442', '#8bc34a'
+
+@timed()
+def iceberg_grid(quartiles, early_date, page=0, per_page=12, num_columns=3, panel_inches=4):
+    """
+    One figure with a panel per iceberg (output of assign_quartiles), for the icebergs of
+    page `page`. Every panel uses the same axes limits, set by the largest iceberg of the
+    date pair, and icebergs are colored by date.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import PatchCollection
+    from matplotlib.patches import PathPatch
+
+    max_width, max_height = quartiles["width"].max(), quartiles["height"].max()
+    icebergs = quartiles.iloc[page * per_page:(page + 1) * per_page]
+
+    num_rows = max(1, math.ceil(len(icebergs) / num_columns))
+    fig, axes = plt.subplots(
+        num_rows, num_columns, figsize=(num_columns * panel_inches, num_rows * panel_inches), squeeze=False
+    )
+    axes = axes.flatten()
+
+    for ax, path, filename in zip(axes, outline_paths(icebergs.geometry), icebergs["shapefile"]):
+        color = early_color if early_date in filename else later_color
+        ax.add_collection(
+            PatchCollection([PathPatch(path)], facecolor=color, edgecolor='black', alpha=0.8, linewidth=2)
+        )
 
         ax.set_xlim(0, max_width)
         ax.set_ylim(0, max_height)
+        ax.set_aspect("equal")
         ax.set_xlabel("Width (m)")
         ax.set_ylabel("Height (m)")
+        ax.set_title(filename, fontsize=10)
+
+    for ax in axes[len(icebergs):]:
+        ax.axis("off")
+
+    fig.tight_layout()
+    return fig
+
+@timed()
+def correlogram(df):
+    df = df.drop(columns=[col for col in UNWANTED_MELT_COLUMNS if col in df.columns])
+    return correlation_heatmap(df.corr())
+
+@timed()
+def correlation_heatmap(corr):
+    """
+    Correlogram of an already computed correlation matrix (see melt_rates.melt_statistics).
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    fig, ax = plt.subplots(figsize=(10, 8))
+    sns.heatmap(corr, annot=True, fmt=".2f", cmap="coolwarm", ax=ax)
+    return fig
 
+@timed()
+def size_distribution_plot(distributions, groups, label="Area (m²)"):
+    """
+    Log-log dN/dx of the chosen groups (see size_distribution.compute_size_distributions)
+    with their power-law fits drawn above the rollover.
+    """
+    import matplotlib.pyplot as plt
+
+    edges = distributions["edges"]
+    centers = np.sqrt(edges[:-1] * edges[1:])
+    fits = distributions["fits"]
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    for group in groups:
+        density = distributions["density"].loc[group].to_numpy()
+        shown = density > 0
+        line, = ax.plot(centers[shown], density[shown], "o", label=group)
+
+        fit = fits.loc[group]
+        if np.isfinite(fit["alpha"]):
+            # Normalised like the histogram: the tail holds tail_count of count icebergs
+            x = centers[centers >= fit["xmin"]]
+            scale = fit["tail_count"] / fit["count"] * (fit["alpha"] - 1) / fit["xmin"]
+            ax.plot(x, scale * (x / fit["xmin"]) ** -fit["alpha"], "-", color=line.get_color(),
+                    label=f"{group}: alpha = {fit['alpha']:.2f}")
+
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_xlabel(label)
+    ax.set_ylabel("Probability density")
+    ax.legend(fontsize=8)
+    ax.set_title("Iceberg size distributions")
+    return fig
+
+@timed()
+def density_plot(density, label, log=False):
+    """
+    Image of a density raster (see density.density_grid) in EPSG:3413 kilometers.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LogNorm
+
+    values = density["values"]
+    finite = values[np.isfinite(values)]
+    norm = LogNorm(finite.min(), max(finite.max(), finite.min() * 10)) if log and finite.min() > 0 else None
+    minx, miny, maxx, maxy = (bound / 1000 for bound in density["bounds"])
+
+    fig, ax = plt.subplots(figsize=(10, 8))
+    image = ax.imshow(values, extent=(minx, maxx, miny, maxy), origin="upper", cmap="viridis", norm=norm,
+                      interpolation="nearest")
+    fig.colorbar(image, ax=ax, label=label)
+    ax.set_aspect("equal")
+    ax.set_xlabel("x (km, EPSG:3413)")
+    ax.set_ylabel("y (km, EPSG:3413)")
+    ax.set_title(f"{label}, {density['resolution']:g} m cells, {density['points']:,} icebergs")
     return fig
 
 def load_and_reproject_shapefile(filepath):
@@ -170,54 +289,3 @@ def calculate_width_height(gdf):
 
     # Return width and height rounded to 2 decimal places
     return round(width, 2), round(height, 2)
-
-def get_available_dates(site_id):
-    """
-    Get available date ranges based on site ID
-    """
-    site_path = os.path.join(SHAPEFILE_CATALOG_DIR, site_id)
-    if os.path.exists(site_path):
-        return [f for f in os.listdir(site_path) if os.path.isdir(os.path.join(site_path, f))]
-    return []
-
-def iceberg_map(glacier_sites, site_id, early_date, later_date):
-    """
-    Interactive map with icebergs
-    """
-    site = glacier_sites[glacier_sites['Glacier_ID'] == site_id]
-    site_lat, site_lon = site.iloc[0]['LAT'], site.iloc[0]['LON']
-
-    m = folium.Map(
-        location=[site_lat, site_lon],
-        zoom_start=12.3,
-        tiles="CartoDB positron"
-    )
-
-    # Add iceberg shapefiles to the map
-    site_path = os.path.join(SHAPEFILE_CATALOG_DIR, site_id, f"{early_date}-{later_date}")
-    if os.path.exists(site_path):
-        shapefiles = [f for f in os.listdir(site_path) if f.endswith(".shp")]
-        for iceberg in shapefiles:
-            shp_path = os.path.join(site_path, iceberg)
-            gdf = load_and_reproject_shapefile(shp_path)
-
-            # Calculate width and height
-            width, height = calculate_width_height(gdf)
-
-            color = "#7a1037" if early_date in iceberg else "#033b59" if later_date in iceberg else "gray"
-            popup_content = f"<strong>Iceberg ID:</strong> {iceberg}<br><strong>Width:</strong> {width} meters<br><strong>Height:</strong> {height} meters"
-
-            # Add GeoJson to map with popups
-            folium.GeoJson(
-                gdf.__geo_interface__,
-                name=iceberg,
-                style_function=lambda x, color=color: {"color": color, "weight": 1},
-                popup=folium.Popup(popup_content, max_width=300)
-            ).add_to(m)
-
-            # Zoom into iceberg centroid
-            centroid = gdf.geometry.centroid.iloc[0]
-            m.location = [centroid.y, centroid.x]
-            m.zoom_start = 12
-
-    return m
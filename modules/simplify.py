@@ -0,0 +1,73 @@
+"""
+Multi-resolution iceberg outlines.
+
+At ingest the catalog stores, next to every full-resolution outline, topology-preserving
+simplifications at a few tolerances in EPSG:3413 (columns geometry_s1, geometry_s5, ...).
+Callers then ask for the outlines that match their display scale, either a map zoom
+level or a matplotlib panel size, and get the coarsest version whose error stays below
+one pixel.
+"""
+import math
+
+import geopandas as gpd
+import shapely
+
+SIMPLIFY_TOLERANCES = [1, 5, 25, 100]  # meters in EPSG:3413
+
+EARTH_CIRCUMFERENCE = 2 * math.pi * 6378137
+
+
+def simplified_column(tolerance):
+    return f"geometry_s{tolerance}"
+
+
+SIMPLIFIED_COLUMNS = [simplified_column(tolerance) for tolerance in SIMPLIFY_TOLERANCES]
+
+
+def add_simplified_columns(icebergs):
+    """
+    Add one simplified copy of the active geometry column per tolerance.
+    """
+    geometries = icebergs.geometry.to_numpy()
+    for tolerance, column in zip(SIMPLIFY_TOLERANCES, SIMPLIFIED_COLUMNS):
+        icebergs[column] = gpd.GeoSeries(
+            shapely.simplify(geometries, tolerance, preserve_topology=True),
+            index=icebergs.index,
+            crs=icebergs.crs,
+        )
+    return icebergs
+
+
+def zoom_meters_per_pixel(zoom, latitude):
+    """
+    Ground size of one pixel of a web map at the given zoom level and latitude.
+    """
+    return EARTH_CIRCUMFERENCE * math.cos(math.radians(latitude)) / (256 * 2 ** zoom)
+
+
+def figure_meters_per_pixel(extent, inches, dpi=100):
+    """
+    Ground size of one pixel when `extent` meters are drawn across `inches` of a figure.
+    """
+    return extent / (inches * dpi)
+
+
+def select_tolerance(meters_per_pixel):
+    """
+    The coarsest stored tolerance that is still finer than one pixel, or None when only
+    the full-resolution outline is good enough.
+    """
+    fitting = [tolerance for tolerance in SIMPLIFY_TOLERANCES if tolerance <= meters_per_pixel]
+    return max(fitting) if fitting else None
+
+
+def simplified_geometry(icebergs, meters_per_pixel):
+    """
+    The outlines of `icebergs` (catalog rows) at the resolution for `meters_per_pixel`,
+    as an EPSG:3413 GeoSeries. Falls back to the full outlines when no stored
+    simplification fits or the frame has no simplified columns.
+    """
+    tolerance = select_tolerance(meters_per_pixel)
+    if tolerance is None or simplified_column(tolerance) not in icebergs.columns:
+        return icebergs.geometry
+    return icebergs[simplified_column(tolerance)]
@@ -0,0 +1,194 @@
+"""
+Iceberg size distributions per site, region and year.
+
+Sizes are the outline areas of the catalog (m²), or any numeric column of the melt-rate
+store such as Volume: outlines alone carry no thickness, so volumes come from the melt
+tables. All groups are binned at once on common log-spaced edges with one np.bincount,
+and every group gets two fits above its rollover (the most populated bin):
+
+    power law          p(x) ~ x^-alpha                      (maximum likelihood, closed form)
+    tapered power law  S(x) = (xmin/x)^beta exp((xmin - x)/xc)  (fragmentation with a
+                       largest-size cutoff xc, maximum likelihood over beta and xc)
+
+Results are cached until the catalog (or melt store) file changes.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from .cache import cached_file_loader
+from .catalog import load_catalog
+from .data_path import CATALOG_INDEX_PATH, GLACIER_LOCATIONS_CSV, MELT_STORE_PATH
+from .instrumentation import timed
+from .loaders import load_glacier_sites
+from .melt_store import add_group_columns, load_melt_store
+
+SIZE_GROUP_COLUMNS = ["site", "region", "year"]
+BINS_PER_DECADE = 8
+
+# Groups with fewer icebergs above the rollover are not fitted
+MIN_FIT_SAMPLES = 10
+
+FIT_COLUMNS = ["count", "xmin", "tail_count", "alpha", "alpha_error", "taper_beta", "taper_corner"]
+
+
+def log_bin_edges(values, bins_per_decade=BINS_PER_DECADE):
+    """
+    Log-spaced edges covering every positive value, aligned on powers of ten.
+    """
+    positive = values[values > 0]
+    if len(positive) == 0:
+        return np.array([1.0, 10.0])
+    low = np.floor(np.log10(positive.min()) * bins_per_decade) / bins_per_decade
+    high = np.ceil(np.log10(positive.max()) * bins_per_decade) / bins_per_decade
+    high = max(high, low + 1 / bins_per_decade)
+    return np.logspace(low, high, int(round((high - low) * bins_per_decade)) + 1)
+
+
+def binned_counts(values, codes, num_groups, edges):
+    """
+    (num_groups, num_bins) histogram of values per group code, in one bincount.
+    """
+    num_bins = len(edges) - 1
+    bins = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, num_bins - 1)
+    valid = (values > 0) & (codes >= 0)
+    flat = codes[valid] * num_bins + bins[valid]
+    return np.bincount(flat, minlength=num_groups * num_bins).reshape(num_groups, num_bins)
+
+
+def power_law_fits(values, codes, num_groups, xmin):
+    """
+    Maximum-likelihood exponent of a continuous power law above xmin[group], for every
+    group at once: alpha = 1 + n / sum(ln(x / xmin)), with standard error
+    (alpha - 1) / sqrt(n).
+    """
+    tail = (codes >= 0) & (values >= xmin[np.maximum(codes, 0)])
+    n = np.bincount(codes[tail], minlength=num_groups).astype(float)
+    log_sum = np.bincount(codes[tail], weights=np.log(values[tail] / xmin[codes[tail]]), minlength=num_groups)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        alpha = 1 + n / log_sum
+        error = (alpha - 1) / np.sqrt(n)
+    return n, alpha, error
+
+
+def tapered_fit(tail, xmin, beta_start):
+    """
+    Maximum-likelihood (beta, corner) of a tapered power law above xmin, see the module
+    docstring. Returns NaNs when the optimisation fails.
+    """
+    from scipy.optimize import minimize
+
+    log_ratio = np.log(xmin / tail).sum()
+    excess = (xmin - tail).sum()
+
+    def negative_log_likelihood(params):
+        beta, corner = np.exp(params)
+        return -(np.log(beta / tail + 1 / corner).sum() + beta * log_ratio + excess / corner)
+
+    start = np.log([max(beta_start, 0.05), tail.max() * 10])
+    result = minimize(negative_log_likelihood, start, method="Nelder-Mead")
+    if not result.success:
+        return np.nan, np.nan
+    beta, corner = np.exp(result.x)
+    return beta, corner
+
+
+@timed("size_distribution.compute")
+def compute_size_distributions(sizes, groups, bins_per_decade=BINS_PER_DECADE):
+    """
+    Log-binned size distributions and fits of `sizes` (array) per label of `groups`
+    (array of hashable labels). Returns a dict with:
+
+        edges    bin edges
+        counts   DataFrame, one row per group, one column per bin (lower edge)
+        density  counts / (bin width * group size), i.e. the normalised dN/dx
+        fits     DataFrame with FIT_COLUMNS per group
+    """
+    sizes = np.asarray(sizes, dtype=float)
+    codes, labels = pd.factorize(pd.Index(groups), sort=True)
+    num_groups = len(labels)
+    edges = log_bin_edges(sizes[np.isfinite(sizes)], bins_per_decade)
+    counts = binned_counts(np.nan_to_num(sizes, nan=-1.0), codes, num_groups, edges)
+
+    totals = counts.sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        density = counts / (np.diff(edges) * totals)
+
+    # The rollover (most populated bin) is the lower bound of the fitted tail
+    xmin = edges[:-1][counts.argmax(axis=1)] if num_groups else np.array([])
+    sizes_for_fit = np.nan_to_num(sizes, nan=-1.0)
+    tail_count, alpha, alpha_error = power_law_fits(sizes_for_fit, codes, num_groups, xmin)
+
+    taper_beta = np.full(num_groups, np.nan)
+    taper_corner = np.full(num_groups, np.nan)
+    order = np.argsort(codes, kind="stable")
+    starts = np.searchsorted(codes[order], np.arange(num_groups + 1))
+    for g in range(num_groups):
+        if tail_count[g] < MIN_FIT_SAMPLES:
+            continue
+        group_sizes = sizes_for_fit[order[starts[g]:starts[g + 1]]]
+        tail = group_sizes[group_sizes >= xmin[g]]
+        taper_beta[g], taper_corner[g] = tapered_fit(tail, xmin[g], alpha[g] - 1)
+
+    too_few = tail_count < MIN_FIT_SAMPLES
+    alpha[too_few], alpha_error[too_few] = np.nan, np.nan
+
+    index = pd.Index(labels, name="group")
+    columns = pd.Index(edges[:-1], name="lower_edge")
+    return {
+        "edges": edges,
+        "counts": pd.DataFrame(counts, index=index, columns=columns),
+        "density": pd.DataFrame(density, index=index, columns=columns),
+        "fits": pd.DataFrame({
+            "count": totals[:, 0],
+            "xmin": xmin,
+            "tail_count": tail_count.astype(int),
+            "alpha": alpha,
+            "alpha_error": alpha_error,
+            "taper_beta": taper_beta,
+            "taper_corner": taper_corner,
+        }, index=index, columns=FIT_COLUMNS),
+    }
+
+
+def group_labels(frame, by):
+    if len(by) == 1:
+        return frame[by[0]].astype(str).to_numpy()
+    return frame[list(by)].astype(str).agg(" / ".join, axis=1).to_numpy()
+
+
+@cached_file_loader
+def read_area_distributions(index_path, by):
+    catalog = load_catalog(index_path)
+    frame = pd.DataFrame({"site": catalog["site"], "early_date": catalog["early_date"]})
+    if os.path.exists(GLACIER_LOCATIONS_CSV):
+        glacier_sites = load_glacier_sites()
+    else:
+        glacier_sites = pd.DataFrame(columns=["Glacier_ID", "Region"])
+    frame = add_group_columns(frame, glacier_sites)
+    return compute_size_distributions(catalog["area"].to_numpy(), group_labels(frame, by))
+
+
+@cached_file_loader
+def read_melt_distributions(store_path, by, column):
+    store = load_melt_store(store_path)
+    return compute_size_distributions(store[column].to_numpy(), group_labels(store, by))
+
+
+def area_distributions(by, index_path=CATALOG_INDEX_PATH):
+    """
+    Size distributions of the outline areas of the catalog, grouped by a list of
+    SIZE_GROUP_COLUMNS. Cached until the catalog changes.
+    """
+    load_catalog(index_path)
+    return read_area_distributions(index_path, tuple(by))
+
+
+def melt_distributions(by, column, store_path=MELT_STORE_PATH):
+    """
+    Size distributions of a melt-rate store column (e.g. Volume), grouped by a list of
+    SIZE_GROUP_COLUMNS. Cached until the store changes.
+    """
+    load_melt_store(store_path)
+    return read_melt_distributions(store_path, tuple(by), column)
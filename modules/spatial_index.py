@@ -0,0 +1,139 @@
+"""
+Spatial index over every iceberg of the catalog.
+
+Two STRtrees are built from columns the catalog index already stores in EPSG:3413, so
+no shapefile is opened: one over the bounding boxes of the outlines (window and polygon
+queries) and one over their centroids (nearest-neighbour queries). The index is built
+once per catalog version and shared by all sessions through modules.cache.
+
+    index = load_spatial_index()
+    in_view = index.query_bounds(-51.2, 69.1, -49.8, 69.3, crs="EPSG:4326", date_pair="20170515-20170611")
+    matches = index.nearest(early_icebergs, site="KOG", date="20170611", max_distance=2000)
+
+Query results are rows of the catalog (GeoDataFrames with every catalog column).
+"""
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from .cache import file_cache
+from .catalog import CATALOG_CRS, load_catalog
+from .data_path import CATALOG_INDEX_PATH
+from .instrumentation import timed
+
+# Bounding boxes given in another CRS are densified before reprojection, so their edges
+# follow the curvature they get in polar stereographic
+DENSIFY_SEGMENTS = 16
+
+
+class SpatialIndex:
+    """
+    STRtrees over the bounding boxes and centroids of the catalog rows.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.boxes = shapely.box(
+            catalog["minx"].to_numpy(), catalog["miny"].to_numpy(),
+            catalog["maxx"].to_numpy(), catalog["maxy"].to_numpy(),
+        )
+        self.centroids = shapely.points(catalog["centroid_x"].to_numpy(), catalog["centroid_y"].to_numpy())
+        self.box_tree = shapely.STRtree(self.boxes)
+        self.centroid_tree = shapely.STRtree(self.centroids)
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def __sizeof__(self):
+        # Two trees of ~64 bytes per node and the box/point arrays; the catalog is cached separately
+        return 4 * 64 * len(self.catalog) + self.boxes.nbytes + self.centroids.nbytes
+
+    def _mask(self, site=None, date_pair=None, date=None, shapefiles=None):
+        mask = np.ones(len(self.catalog), dtype=bool)
+        if site is not None:
+            mask &= (self.catalog["site"] == site).to_numpy()
+        if date_pair is not None:
+            mask &= (self.catalog["date_pair"] == date_pair).to_numpy()
+        if date is not None:
+            mask &= self.catalog["shapefile"].str.contains(date, regex=False).to_numpy()
+        if shapefiles is not None:
+            mask &= self.catalog["shapefile"].isin(shapefiles).to_numpy()
+        return mask
+
+    def _rows(self, positions, **filters):
+        positions = np.sort(positions)
+        positions = positions[self._mask(**filters)[positions]]
+        return self.catalog.iloc[positions]
+
+    def query_geometry(self, geometry, crs=CATALOG_CRS, predicate="intersects", exact=True, **filters):
+        """
+        Icebergs whose outline satisfies `predicate` with `geometry` (e.g. a fjord polygon),
+        optionally restricted with site=, date_pair=, date= or shapefiles=. With
+        exact=False only the bounding boxes are compared, which is faster and enough for
+        drawing a viewport.
+        """
+        if crs != CATALOG_CRS:
+            geometry = to_catalog_crs(geometry, crs)
+        positions = self.box_tree.query(geometry, predicate="intersects")
+        if exact and len(positions):
+            outlines = self.catalog.geometry.to_numpy()[positions]
+            positions = positions[getattr(shapely, predicate)(outlines, geometry)]
+        return self._rows(positions, **filters)
+
+    def query_bounds(self, minx, miny, maxx, maxy, crs=CATALOG_CRS, exact=False, **filters):
+        """
+        Icebergs intersecting a window, e.g. a map viewport in EPSG:4326 (lon/lat).
+        """
+        return self.query_geometry(shapely.box(minx, miny, maxx, maxy), crs, exact=exact, **filters)
+
+    def nearest(self, icebergs, max_distance=None, **filters):
+        """
+        For every row of `icebergs` (catalog rows), the nearest catalog iceberg by centroid
+        among those matching site=, date_pair= or date=. Returns a DataFrame with the
+        'shapefile' of the query iceberg, the 'nearest' shapefile and their 'distance' in
+        meters; icebergs with nothing within max_distance are left out.
+        """
+        mask = self._mask(**filters)
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == len(self.catalog):
+            tree = self.centroid_tree
+        else:
+            tree = shapely.STRtree(self.centroids[candidates])
+
+        points = shapely.points(icebergs["centroid_x"].to_numpy(), icebergs["centroid_y"].to_numpy())
+        (query, found), distances = tree.query_nearest(
+            points, max_distance=max_distance, return_distance=True, all_matches=False,
+        )
+        if tree is not self.centroid_tree:
+            found = candidates[found]
+
+        return pd.DataFrame({
+            "shapefile": icebergs["shapefile"].to_numpy()[query],
+            "nearest": self.catalog["shapefile"].to_numpy()[found],
+            "distance": distances,
+        })
+
+
+def to_catalog_crs(geometry, crs):
+    """
+    Reproject a single geometry to EPSG:3413, densifying it first.
+    """
+    xmin, ymin, xmax, ymax = shapely.bounds(geometry)
+    step = max(xmax - xmin, ymax - ymin) / DENSIFY_SEGMENTS
+    if step > 0:
+        geometry = shapely.segmentize(geometry, step)
+    return gpd.GeoSeries([geometry], crs=crs).to_crs(CATALOG_CRS).iloc[0]
+
+
+@timed("spatial_index.build")
+def build_spatial_index(index_path=CATALOG_INDEX_PATH):
+    return SpatialIndex(load_catalog(index_path))
+
+
+def load_spatial_index(index_path=CATALOG_INDEX_PATH):
+    """
+    The SpatialIndex of the current catalog, rebuilt only after the catalog changes.
+    """
+    load_catalog(index_path)  # Builds the catalog if it does not exist yet
+    return file_cache.load(build_spatial_index, index_path)
@@ -0,0 +1,331 @@
+"""
+Mapbox Vector Tile (MVT) server for iceberg outlines from the catalog.
+
+For whole-catalog views the maps only fetch the tiles in view, so memory and transfer
+stay bounded no matter how many icebergs the catalog holds. Outlines are simplified per
+zoom level (about one screen pixel of tolerance) before encoding.
+
+The server is a plain localhost HTTP server: run it next to Streamlit with
+
+    python -m modules.tiles --port 8765              # serve tiles
+    python -m modules.tiles --seed 0-10              # precompute tiles for zooms 0 to 10
+
+or start it inside the Streamlit process with start_tile_server(), which reuses a server
+already listening on the port (or the one ICE_AGE_TILE_URL points at). Rendered tiles are
+written below TILE_CACHE_DIR, in a folder tied to the catalog version, so a rebuilt
+catalog never serves stale tiles. Requires the optional `mapbox-vector-tile` package.
+
+The same server streams the bulk exports of modules.export from /exports/<name>; the
+viewer links to them with export_url(), so a download never passes through Streamlit.
+When the browser does not run on the Streamlit host, set ICE_AGE_TILE_URL to the public
+URL proxied to the tile server: without it, tile and export URLs point at localhost.
+"""
+import argparse
+import errno
+import hashlib
+import math
+import os
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import URLError
+from urllib.parse import quote, unquote
+from urllib.request import urlopen
+
+import numpy as np
+
+from .cache import atomic_path
+from .data_path import CATALOG_INDEX_PATH, TILE_CACHE_DIR
+
+# shapely and the catalog are imported where tiles are rendered: pages that only start the
+# server or add the tile layer to a map do not load them.
+
+TILE_CRS = "EPSG:3857"
+TILE_LAYER = "icebergs"
+TILE_EXTENT = 4096
+TILE_BUFFER = 64  # in tile units, so outlines crossing a tile edge join up seamlessly
+
+DEFAULT_PORT = 8765
+# Set this when the browser reaches the tile server through a proxy rather than localhost;
+# pages then use that server and never start their own
+TILE_URL_ENV = "ICE_AGE_TILE_URL"
+# Answered by every tile server, so a busy port can be told apart from another program
+STATUS_PATH = "/status"
+STATUS_BODY = b"ice-age tiles"
+
+WEB_MERCATOR_HALF_WORLD = math.pi * 6378137
+
+
+def tile_bounds(z, x, y):
+    """
+    (minx, miny, maxx, maxy) of a XYZ tile in EPSG:3857 meters.
+    """
+    size = 2 * WEB_MERCATOR_HALF_WORLD / 2 ** z
+    minx = -WEB_MERCATOR_HALF_WORLD + x * size
+    maxy = WEB_MERCATOR_HALF_WORLD - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def tile_tolerance(z):
+    # One pixel of a 256 px tile; anything finer is invisible at this zoom
+    return 2 * WEB_MERCATOR_HALF_WORLD / (256 * 2 ** z)
+
+
+class TileSource:
+    """
+    Iceberg outlines of the whole catalog in EPSG:3857 with a spatial index, able to
+    render any XYZ tile on demand.
+    """
+
+    def __init__(self, index_path=CATALOG_INDEX_PATH, cache_dir=TILE_CACHE_DIR):
+        import shapely
+
+        from .catalog import catalog_fingerprint, load_catalog
+
+        catalog = load_catalog(index_path)
+        self.geometries = catalog["geometry_4326"].to_crs(TILE_CRS).to_numpy()
+        self.properties = catalog[["site", "date_pair", "shapefile", "width", "height"]].round(2)
+        self.tree = shapely.STRtree(self.geometries)
+
+        self.index_path = index_path
+        self.fingerprint = catalog_fingerprint(index_path)
+        version = hashlib.sha1(repr(self.fingerprint).encode()).hexdigest()[:12]
+        self.cache_dir = os.path.join(cache_dir, version) if cache_dir else None
+        self.render = lru_cache(maxsize=2048)(self._render)
+
+    def tile_path(self, z, x, y):
+        return os.path.join(self.cache_dir, str(z), str(x), f"{y}.pbf")
+
+    def get_tile(self, z, x, y):
+        """
+        Encoded tile bytes, read from the tile cache when it was rendered before.
+        """
+        if self.cache_dir is None:
+            return self.render(z, x, y)
+
+        path = self.tile_path(z, x, y)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return f.read()
+
+        data = self.render(z, x, y)
+        with atomic_path(path) as tmp_path, open(tmp_path, "wb") as f:
+            f.write(data)
+        return data
+
+    def _render(self, z, x, y):
+        import mapbox_vector_tile
+        import shapely
+
+        bounds = tile_bounds(z, x, y)
+        pad = (bounds[2] - bounds[0]) * TILE_BUFFER / TILE_EXTENT
+        padded = (bounds[0] - pad, bounds[1] - pad, bounds[2] + pad, bounds[3] + pad)
+
+        hits = np.sort(self.tree.query(shapely.box(*padded)))
+        geometries = shapely.simplify(self.geometries[hits], tile_tolerance(z), preserve_topology=True)
+        geometries = shapely.clip_by_rect(geometries, *padded)
+        keep = ~shapely.is_empty(geometries)
+
+        features = [
+            {"geometry": geometry, "properties": properties}
+            for geometry, properties in zip(
+                geometries[keep], self.properties.iloc[hits[keep]].to_dict("records")
+            )
+        ]
+        return mapbox_vector_tile.encode(
+            [{"name": TILE_LAYER, "features": features}],
+            default_options={"quantize_bounds": bounds, "extents": TILE_EXTENT},
+        )
+
+    def seed(self, min_zoom, max_zoom):
+        """
+        Precompute every non-empty tile between min_zoom and max_zoom.
+        Returns the number of tiles written.
+        """
+        import shapely
+
+        minx, miny, maxx, maxy = shapely.total_bounds(self.geometries)
+        count = 0
+        for z in range(min_zoom, max_zoom + 1):
+            size = 2 * WEB_MERCATOR_HALF_WORLD / 2 ** z
+            x_range = range(int((minx + WEB_MERCATOR_HALF_WORLD) // size), int((maxx + WEB_MERCATOR_HALF_WORLD) // size) + 1)
+            y_range = range(int((WEB_MERCATOR_HALF_WORLD - maxy) // size), int((WEB_MERCATOR_HALF_WORLD - miny) // size) + 1)
+            for x in x_range:
+                for y in y_range:
+                    if len(self.tree.query(shapely.box(*tile_bounds(z, x, y)))):
+                        self.get_tile(z, x, y)
+                        count += 1
+        return count
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    # Serves /tiles/{z}/{x}/{y}.pbf from the server's TileSource
+    def do_GET(self):
+        if self.path == STATUS_PATH:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(STATUS_BODY)))
+            self.end_headers()
+            self.wfile.write(STATUS_BODY)
+            return
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "exports":
+            self.send_export(unquote(parts[1]))
+            return
+        try:
+            if len(parts) != 4 or parts[0] != "tiles" or not parts[3].endswith(".pbf"):
+                raise ValueError
+            z, x, y = int(parts[1]), int(parts[2]), int(parts[3][:-4])
+        except ValueError:
+            self.send_error(404)
+            return
+
+        data = self.server.tile_source().get_tile(z, x, y)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.mapbox-vector-tile")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Cache-Control", "public, max-age=3600")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_export(self, name):
+        # Bulk exports (modules.export) are streamed from disk in chunks
+        from .export import export_path, stream_export
+
+        path = export_path(name)
+        if path is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.send_header("Content-Disposition", f'attachment; filename="{name}"')
+        self.end_headers()
+        stream_export(path, self.wfile)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TileServer(ThreadingHTTPServer):
+    """
+    HTTP server of the tile endpoints. The TileSource, which reprojects and indexes every
+    outline of the catalog, is only built on the first tile request, and rebuilt when the
+    catalog changes.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, index_path=CATALOG_INDEX_PATH, cache_dir=TILE_CACHE_DIR):
+        super().__init__(address, TileRequestHandler)
+        self.index_path = index_path
+        self.cache_dir = cache_dir
+        self.source = None
+        self._source_lock = threading.Lock()
+
+    def tile_source(self):
+        from .catalog import catalog_fingerprint
+
+        with self._source_lock:
+            # Pick up a rebuilt catalog without restarting the server
+            if self.source is None or catalog_fingerprint(self.index_path) != self.source.fingerprint:
+                self.source = TileSource(self.index_path, self.cache_dir)
+            return self.source
+
+
+def make_tile_server(port=DEFAULT_PORT, host="127.0.0.1"):
+    return TileServer((host, port))
+
+
+def is_tile_server(port=DEFAULT_PORT, host="127.0.0.1"):
+    """
+    Whether a tile server of this module answers on host:port.
+    """
+    try:
+        with urlopen(f"http://{host}:{port}{STATUS_PATH}", timeout=2) as response:
+            return response.read() == STATUS_BODY
+    except (URLError, OSError):
+        return False
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_tile_server(port=DEFAULT_PORT, host="127.0.0.1"):
+    """
+    Start the tile server in a background thread of this process (once) and return the
+    tile URL template for the maps. Streamlit sessions share the same server. Nothing is
+    started when ICE_AGE_TILE_URL is set or a tile server, e.g. a standalone
+    `python -m modules.tiles`, already listens on the port.
+    """
+    global _server
+    with _server_lock:
+        if _server is None and TILE_URL_ENV not in os.environ:
+            try:
+                server = make_tile_server(port, host)
+            except OSError as exc:
+                if exc.errno != errno.EADDRINUSE or not is_tile_server(port, host):
+                    raise
+                server = False  # Served by another process
+            else:
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+            _server = server
+    return tile_url(port)
+
+
+def server_url(port=DEFAULT_PORT):
+    """
+    Base URL the browser reaches the tile server at: ICE_AGE_TILE_URL, or localhost when
+    it is not set.
+    """
+    return os.environ.get(TILE_URL_ENV, f"http://localhost:{port}").rstrip("/")
+
+
+def tile_url(port=DEFAULT_PORT):
+    return f"{server_url(port)}/tiles/{{z}}/{{x}}/{{y}}.pbf"
+
+
+def export_url(name, port=DEFAULT_PORT):
+    """
+    Download URL of a finished export (see modules.export), streamed by the tile server.
+    """
+    return f"{server_url(port)}/exports/{quote(name)}"
+
+
+def add_vector_tile_layer(m, url, name="Iceberg outlines (all sites)", color="#033b59"):
+    """
+    Add the catalog vector tiles to a folium map; the browser only requests tiles in view.
+    """
+    from folium.plugins import VectorGridProtobuf
+
+    options = {
+        "vectorTileLayerStyles": {
+            TILE_LAYER: {"color": color, "weight": 1, "fill": True, "fillOpacity": 0.2},
+        },
+        "maxNativeZoom": 14,
+    }
+    VectorGridProtobuf(url, name=name, options=options).add_to(m)
+    return m
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve or precompute catalog vector tiles.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--seed", metavar="MIN-MAX", help="Precompute tiles for a zoom range, e.g. 0-10, then exit.")
+    args = parser.parse_args()
+
+    if args.seed:
+        min_zoom, max_zoom = (int(z) for z in args.seed.split("-"))
+        count = TileSource().seed(min_zoom, max_zoom)
+        print(f"Wrote {count} tiles for zoom {min_zoom}-{max_zoom}")
+        return
+
+    server = make_tile_server(args.port, args.host)
+    print(f"Serving {tile_url(args.port)}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Background worker that keeps every derived artifact up to date.
+
+New or changed shapefiles under SHAPEFILE_CATALOG_DIR and melt-rate tables under
+MELT_RATES_DIR would otherwise only be processed inside the page rerun of the first
+visitor after an update. Run this next to Streamlit instead:
+
+    python -m modules.worker                    # poll every 60 s
+    python -m modules.worker --once             # refresh once and exit
+    python -m modules.worker --tiles 0-10       # also precompute vector tiles
+
+On every poll the folders are scanned (a stat per file, nothing is opened) and compared
+with what the catalog index and melt-rate store hold. Only when something changed are
+the artifacts rebuilt, each of them written next to its target and swapped in
+atomically:
+
+    catalog index    reprojected outlines, areas, bounds, shape metrics, simplifications
+    melt-rate store  every melt table in one file
+    geometry store   memory-mapped outlines (modules.geometry_store)
+    figure cache     quartile and grid figures of every date pair, correlograms
+    vector tiles     optional, for a zoom range
+
+Pages pick the new files up on their next rerun (modules.cache keys on file
+fingerprints) and only fall back to building something themselves when no worker ran.
+An artifact that fails is logged and retried on the next poll, and a date pair whose
+figures fail is logged and skipped; neither stops the worker.
+"""
+import argparse
+import os
+import time
+import traceback
+
+import pandas as pd
+
+from .catalog import build_catalog, scan_catalog
+from .data_path import CATALOG_INDEX_PATH, MELT_RATES_DIR, MELT_STORE_PATH, SHAPEFILE_CATALOG_DIR
+from .instrumentation import timed
+from .melt_store import build_melt_store, scan_melt_rates
+
+DEFAULT_INTERVAL = 60  # seconds between two scans
+
+FINGERPRINT_COLUMNS = ["path", "mtime", "size"]
+
+
+def log(message):
+    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {message}", flush=True)
+
+
+def attempt(name, refresh):
+    """
+    Result of refresh(), or None after logging the error when it raised.
+    """
+    try:
+        return refresh()
+    except Exception as exc:
+        log(f"{name} failed: {type(exc).__name__}: {exc}")
+        traceback.print_exc()
+        return None
+
+
+def file_set(files):
+    return set(files[FINGERPRINT_COLUMNS].itertuples(index=False, name=None))
+
+
+def indexed_files(index_path):
+    """
+    (path, mtime, size) of every file an index or store was built from.
+    """
+    if not os.path.exists(index_path):
+        return set()
+    return file_set(pd.read_parquet(index_path, columns=FINGERPRINT_COLUMNS))
+
+
+class Worker:
+    """
+    Polls the data folders and refreshes the artifacts derived from them. Files that
+    produce no rows (empty or unreadable shapefiles, empty tables) are remembered, so
+    they do not trigger a rebuild on every poll until they change again.
+    """
+
+    def __init__(self, warm_figures=True, tile_zooms=None):
+        self.warm_figures = warm_figures
+        self.tile_zooms = tile_zooms
+        self.skipped = {"catalog": set(), "melt": set()}
+        # Set when a derived artifact failed, so the next poll refreshes them again
+        self.retry_derived = False
+
+    def _changed(self, name, files, index_path):
+        return file_set(files) - self.skipped[name] != indexed_files(index_path)
+
+    def refresh_catalog(self):
+        files = scan_catalog(SHAPEFILE_CATALOG_DIR)
+        if not self._changed("catalog", files, CATALOG_INDEX_PATH):
+            return None
+        catalog, summary = build_catalog()
+        self.skipped["catalog"] = file_set(files) - indexed_files(CATALOG_INDEX_PATH)
+        for result in summary["failed"]:
+            print(f"Failed to load {result.path}: {result.error}")
+        return f"catalog: {summary['ingested']} ingested, {summary['removed']} removed, {len(catalog)} icebergs"
+
+    def refresh_melt_store(self):
+        tables = scan_melt_rates(MELT_RATES_DIR)
+        if not self._changed("melt", tables, MELT_STORE_PATH):
+            return None
+        store, summary = build_melt_store()
+        self.skipped["melt"] = file_set(tables) - indexed_files(MELT_STORE_PATH)
+        return f"melt store: {summary['read']} tables read, {summary['removed']} removed, {len(store)} icebergs"
+
+    def refresh_geometry_store(self):
+        from .geometry_store import load_geometry_store
+
+        return f"geometry store: {len(load_geometry_store())} icebergs"
+
+    def refresh_figures(self):
+        # warm() reports and skips the date pairs that fail
+        from .figure_cache import warm
+
+        return f"figures: {warm()} cached"
+
+    def refresh_tiles(self):
+        from .tiles import TileSource
+
+        min_zoom, max_zoom = self.tile_zooms
+        return f"tiles: {TileSource().seed(min_zoom, max_zoom)} for zoom {min_zoom}-{max_zoom}"
+
+    def refresh_derived(self):
+        refreshes = [("geometry store", self.refresh_geometry_store)]
+        if self.warm_figures:
+            refreshes.append(("figures", self.refresh_figures))
+        if self.tile_zooms:
+            refreshes.append(("tiles", self.refresh_tiles))
+        results = [attempt(name, refresh) for name, refresh in refreshes]
+        self.retry_derived = None in results
+        return [message for message in results if message]
+
+    @timed("worker.refresh")
+    def refresh(self, force=False):
+        """
+        One poll. Returns a line per refreshed artifact, empty when nothing changed. Each
+        artifact is refreshed on its own, a failing one is logged and the others go on.
+        """
+        messages = [
+            message
+            for message in (attempt("catalog", self.refresh_catalog), attempt("melt store", self.refresh_melt_store))
+            if message
+        ]
+        if messages or force or self.retry_derived:
+            messages += self.refresh_derived()
+        return messages
+
+    def run(self, interval=DEFAULT_INTERVAL, once=False):
+        # The first pass also builds whatever is missing, e.g. after a fresh checkout
+        force = True
+        while True:
+            start = time.perf_counter()
+            messages = attempt("refresh", lambda: self.refresh(force))
+            if messages is None:
+                messages = []  # Logged; the next poll starts over, still forced if this was the first
+            else:
+                force = False
+            for message in messages:
+                log(message)
+            if messages:
+                log(f"refreshed in {time.perf_counter() - start:.1f} s")
+            if once:
+                return
+            time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the catalog, stores, figures and tiles up to date.")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="Seconds between two scans.")
+    parser.add_argument("--once", action="store_true", help="Refresh once and exit.")
+    parser.add_argument("--no-figures", action="store_true", help="Do not pre-render figures.")
+    parser.add_argument("--tiles", metavar="MIN-MAX", help="Also precompute vector tiles for a zoom range, e.g. 0-10.")
+    args = parser.parse_args()
+
+    tile_zooms = tuple(int(z) for z in args.tiles.split("-")) if args.tiles else None
+    worker = Worker(warm_figures=not args.no_figures, tile_zooms=tile_zooms)
+    try:
+        worker.run(args.interval, once=args.once)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
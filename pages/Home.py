@@ -1,6 +1,8 @@
 import streamlit as st
 
-from modules.plotting import distribution_plot, overview_map
+from modules.figure_cache import distribution_figure
+from modules.maps import overview_map
+from modules.tiles import start_tile_server
 
 st.html(
     '''
@@ -29,10 +31,13 @@ map_style = st.sidebar.selectbox(
     index=0  #This line sets the default, change to 1 for dark_matter default.
 )
 
+# Iceberg outlines of every site are streamed as vector tiles, only for the area in view
+show_all_icebergs = st.sidebar.checkbox("Show all iceberg outlines", value=False)
+
 
 # Create the map with interactive controls in an expandable section
 with st.expander("🗺️ Map of Greenland with selected study sites", expanded=True):
-    overview_map(map_style)
+    overview_map(map_style, tile_url=start_tile_server() if show_all_icebergs else None)
 
 st.markdown("Years represented in study: 2011 - 2023")
 
@@ -88,4 +93,4 @@ st.info(
 )
 
 # Distribution plot
-st.pyplot(distribution_plot())
+st.image(distribution_figure())
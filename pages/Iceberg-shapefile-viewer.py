@@ -1,13 +1,14 @@
 import streamlit as st
 import os
-import geopandas as gpd
-import matplotlib.pyplot as plt
 import pandas as pd
-from shapely.affinity import translate
-import io
 
-from modules.data_path import SHAPEFILE_CATALOG_DIR
-from modules.plotting import iceberg_quartiles
+from modules.catalog import catalog_date_pairs, catalog_sites
+from modules.data_path import GLACIER_LOCATIONS_CSV, SHAPEFILE_CATALOG_DIR
+from modules.export import EXPORT_FORMATS, export_file
+from modules.figure_cache import GRID_PAGE_SIZE, figure_icebergs, figure_quartiles, iceberg_grid_figure, quartile_figure
+from modules.geometry_store import load_geometry_store
+from modules.loaders import load_glacier_sites
+from modules.tiles import TILE_URL_ENV, export_url, start_tile_server
 
 # Title of the page with description:
 st.title("🔍👀 Iceberg Shapefile Viewer:")
@@ -23,13 +24,12 @@ with st.container():
     st.header("Filter")
     menu_col1, menu_col2, menu_col3 = st.columns(3)
 
-#This will load the shapefiles, they will plot whether they exist within the folders or not.
-if os.path.exists(SHAPEFILE_CATALOG_DIR):
-    site_names = [
-        name for name in sorted(os.listdir(SHAPEFILE_CATALOG_DIR) )
-        if os.path.isdir(os.path.join(SHAPEFILE_CATALOG_DIR, name))
-    ]
-
+#This will load the icebergs from the memory-mapped geometry store, so no shapefile has to be opened here
+#and only the outlines the figures draw, for the selected date pair, are turned into shapely objects.
+store = load_geometry_store()
+catalog = store.attributes
+site_names = catalog_sites(catalog)
+if site_names:
     # The default option the first found
     default_site_name = site_names[0]
     with menu_col1:
@@ -40,20 +40,15 @@ if os.path.exists(SHAPEFILE_CATALOG_DIR):
             key="site_name_selectbox"
         )
 
-    #This will get all of the available data for the date folders for the selected site, then it will sort the dates.
+    #This will get all of the available date pairs for the selected site, already sorted by the catalog.
     if site_name:
-        site_path = os.path.join(SHAPEFILE_CATALOG_DIR, site_name)
-        date_folders = [folder for folder in os.listdir(site_path) if '-' in folder]
-        date_folders.sort() 
-        
+        date_folders = catalog_date_pairs(catalog, site_name)
+
         #This will Pre-load dates based on the available folders. The default date range is set here and it can be changed if you'd like.
         date_options = [
             (folder.split('-')[0], folder.split('-')[1])
             for folder in date_folders
         ]
-        date_options = [
-            (start_date, end_date) for start_date, end_date in date_options
-        ]
 
         default_date_range = date_folders[0]
         default_dates = (default_date_range.split('-')[0], default_date_range.split('-')[1])
@@ -66,95 +61,101 @@ if os.path.exists(SHAPEFILE_CATALOG_DIR):
                 index=date_options.index(default_dates) if default_dates in date_options else 0,
                 key="date_range_selectbox"
             )
-        
+
         if selected_dates:
             early_date, late_date = selected_dates
             date_range_folder = f"{early_date}-{late_date}"
-            target_folder = os.path.join(site_path, date_range_folder)
-
-            if os.path.exists(target_folder):
-                shapefiles = [
-                    file for file
-                    in os.listdir(target_folder) if file.endswith('.shp')
-                ]
-
-                if shapefiles:
-                    st.subheader(f"Displaying {len(shapefiles)} Shapefiles")
-
-                    max_width, max_height = 0, 0
-                    shapefile_metadata = []
-                    area_data = []
-
-                    for filename in shapefiles:
-                        shapefile_path = os.path.join(target_folder, filename)
-                        gdf = gpd.read_file(shapefile_path)
+            target_folder = os.path.join(SHAPEFILE_CATALOG_DIR, site_name, date_range_folder)
+            icebergs = figure_icebergs(store, site_name, date_range_folder)
 
-                        if gdf.crs is None:
-                            gdf = gdf.set_crs('EPSG:3413')
-                        gdf = gdf.to_crs('EPSG:3413')
+            if not icebergs.empty:
+                st.subheader(f"Displaying {len(icebergs)} Shapefiles")
 
-                        if not gdf.empty:
-                            overall_bounds = gdf.total_bounds
-                            width = overall_bounds[2] - overall_bounds[0]
-                            height = overall_bounds[3] - overall_bounds[1]
-                            max_width = max(max_width, width)
-                            max_height = max(max_height, height)
+                # Areas, sizes, quartiles and origin-translated outlines are computed together, once.
+                # Outlines are simplified to the resolution of the figure panels, used by both figures.
+                quartiles = figure_quartiles(icebergs)
 
-                            area = gdf.area.sum() 
-                            area_data.append(area)
+                # The grid is drawn one page of icebergs per figure; more pages load on request
+                pages_key = f"grid_pages_{site_name}_{date_range_folder}"
+                num_pages = -(-len(quartiles) // GRID_PAGE_SIZE)
+                pages_shown = min(st.session_state.setdefault(pages_key, 1), num_pages)
 
-                            shapefile_metadata.append((filename, gdf, width, height))
+                for page in range(pages_shown):
+                    st.image(iceberg_grid_figure(site_name, date_range_folder, icebergs, quartiles, page))
 
-                    num_columns = 3
-                    cols = st.columns(num_columns)
+                if pages_shown < num_pages:
+                    remaining = len(quartiles) - pages_shown * GRID_PAGE_SIZE
+                    if st.button(f"Show more icebergs ({remaining} more)"):
+                        st.session_state[pages_key] = pages_shown + 1
+                        st.rerun()
 
-                    for i, (filename, gdf, width, height) in enumerate(shapefile_metadata):
-                        col = cols[i % num_columns]
-                        with col:
-                            fig, ax = plt.subplots(figsize=(6, 6))
-                            color = '#f5a442' if early_date in filename else '#8bc34a'
-
-                            overall_bounds = gdf.total_bounds
-                            gdf['geometry'] = gdf['geometry'].apply(lambda geom: translate(geom, -overall_bounds[0], -overall_bounds[1]))
-
-                            gdf.plot(ax=ax, color=color, edgecolor='black', alpha=0.8, linewidth=2)
-
-                            ax.set_xlim(0, max_width)
-                            ax.set_ylim(0, max_height)
-                            ax.set_xlabel("Width (m)")
-                            ax.set_ylabel("Height (m)")
-                            ax.set_title(filename, fontsize=10)
-                            ax.axis("on")
-
-                            st.pyplot(fig)
-
-                    # This will display an iceberg area information table, necessary for quartile sorting:
-                    area_df = pd.DataFrame({"Shapefile": shapefiles, "Area (m²)": area_data})
-                    st.subheader("Iceberg Area Information:")
-                    st.dataframe(area_df)
+                # This will display an iceberg area information table, necessary for quartile sorting:
+                area_df = pd.DataFrame({"Shapefile": quartiles["shapefile"], "Area (m²)": quartiles["area"]})
+                st.subheader("Iceberg Area Information:")
+                st.dataframe(area_df)
 
 #This codeblock is helpful for debugging, locating missing files, and ensuring that the path to data is correct:
-                else:
-                    st.error(f"No shapefiles found in the folder: {target_folder}") 
             else:
-                st.error(f"Target folder '{target_folder}' does not exist. Please check the dates and site name.")
+                st.error(f"No shapefiles found in the folder: {target_folder}")
+                st.stop()
         else:
             st.info("Please select a date range to proceed!")
+            st.stop()
+else:
+    st.error(f"No shapefiles found in the catalog: {SHAPEFILE_CATALOG_DIR}")
+    st.stop()
 
 st.title("📊 Quartile-Based Iceberg Shape Comparison")
-area_df["Quartile"] = pd.qcut(area_df["Area (m²)"], 4, labels=["Q1", "Q2", "Q3", "Q4"])
 
-# Plot figure with all shapes
-st.pyplot(iceberg_quartiles(area_df, target_folder))
+# Plot figure with all shapes, reusing the outlines already loaded above
+quartile_png = quartile_figure(site_name, date_range_folder, icebergs, quartiles)
+st.image(quartile_png)
 
 # This will allow you to save the image as a .png file. 
-image_stream = io.BytesIO()
-fig.savefig(image_stream, format='png', bbox_inches="tight")
-image_stream.seek(0)
-
 st.download_button(
     label="💾 Save Image",
-    data=image_stream,
+    data=quartile_png,
     file_name="quartile_icebergs.png",
     mime="image/png"
 )
+
+# Bulk export of outlines and metrics. The file is only written when asked for, in chunks,
+# and offered for download once it is complete on disk.
+st.title("📦 Export Icebergs")
+regions = {}
+if os.path.exists(GLACIER_LOCATIONS_CSV):
+    regions = load_glacier_sites().drop_duplicates("Glacier_ID").set_index("Glacier_ID")["Region"].to_dict()
+scopes = {
+    f"Date pair {date_range_folder}": {"site": site_name, "date_pair": date_range_folder},
+    f"Site {site_name}": {"site": site_name},
+}
+if site_name in regions:
+    scopes[f"Region {regions[site_name]}"] = {"region": regions[site_name]}
+scopes["Whole catalog"] = {}
+
+export_col1, export_col2 = st.columns(2)
+with export_col1:
+    export_scope = st.selectbox("Icebergs to export", list(scopes))
+with export_col2:
+    export_format = st.selectbox("Format", list(EXPORT_FORMATS))
+
+export_key = f"export_{export_format}_{scopes[export_scope]}"
+if st.button("Prepare export"):
+    with st.spinner("Writing the export..."):
+        st.session_state[export_key] = export_file(export_format, **scopes[export_scope])
+
+export_path = st.session_state.get(export_key)
+if export_path and os.path.exists(export_path):
+    export_name = os.path.basename(export_path)
+    # The tile server streams the file to the browser; it never passes through this script.
+    try:
+        start_tile_server()
+    except OSError as e:
+        st.warning(f"The export is ready at {export_path}, but the download server could not start: {e}")
+    else:
+        st.link_button(
+            f"💾 Download {export_name} ({os.path.getsize(export_path) / 1e6:.1f} MB)",
+            export_url(export_name),
+        )
+        if TILE_URL_ENV not in os.environ:
+            st.caption(f"Served from localhost; set {TILE_URL_ENV} when the app is opened from another machine.")
@@ -1,17 +1,29 @@
 import streamlit as st
-import pandas as pd
 from streamlit_folium import st_folium
-import os
 
-from modules.data_path import GLACIER_LOCATIONS_CSV, SHAPEFILE_CATALOG_DIR
-from modules.plotting import iceberg_map, get_available_dates
+from modules.catalog import catalog_icebergs, load_catalog
+from modules.density import DENSITY_RESOLUTIONS, DENSITY_STATISTICS, density_statistics
+from modules.drift import load_drift
+from modules.instrumentation import span
+from modules.loaders import load_glacier_sites
+from modules.maps import (
+    density_layer,
+    drift_layer,
+    folium_bounds,
+    get_available_dates,
+    iceberg_base_map,
+    iceberg_layer,
+    icebergs_in_view,
+    viewport_bounds,
+)
+from modules.tiles import start_tile_server
 
 # Title and description
 st.title("🗺️ Visualize iceberg spatial distributions")
 st.markdown("This interactive map allows you to zoom into specific sites and visualize iceberg distributions in Greenland.")
 st.info('Click here for the [Fjord Abbreviation List & Paired Dates](https://docs.google.com/spreadsheets/d/1kCcKqf717kK3_Xx-GDe0f61jhlUpZ5n6BN1qtiw7S4w/edit?gid=0#gid=0)')
 
-glacier_sites = pd.read_csv(GLACIER_LOCATIONS_CSV)
+glacier_sites = load_glacier_sites()
 
 # User filter top row
 with st.container():
@@ -47,10 +59,9 @@ else:
     early_date, later_date = "", ""
 
 # Sidebar: Select icebergs for map
-shapefile_dir = os.path.join(SHAPEFILE_CATALOG_DIR, site_id, f"{early_date}-{later_date}")
-shapefiles = [
-    f for f in os.listdir(shapefile_dir) if f.endswith(".shp")
-] if os.path.exists(shapefile_dir) else []
+date_pair = f"{early_date}-{later_date}"
+pair_icebergs = catalog_icebergs(load_catalog(), site_id, date_pair)
+shapefiles = pair_icebergs["shapefile"].tolist()
 
 # Select specific icebergs
 with menu_col_2_2:
@@ -60,16 +71,76 @@ with menu_col_2_3:
     st.markdown("👆Click the icebergs to view their width, height, and more details!")
     st.markdown("✋ Pan around the map to see how icebergs drift!")
     st.markdown("🔎 Zoom out to see the full extent!")
+    show_catalog = st.checkbox("Show icebergs of all sites and dates")
+    show_drift = st.checkbox("Show drift between the two dates")
+    show_density = st.checkbox("Show iceberg density of the region")
 
-# Generate and display map
+if show_density:
+    # Every iceberg of the site's region, all dates, binned into cells instead of drawn one by one
+    region = glacier_sites.loc[glacier_sites["Glacier_ID"] == site_id, "Region"].iloc[0]
+    density_col_1, density_col_2 = st.columns(2)
+    with density_col_1:
+        density_statistic = st.selectbox(
+            "Density of", list(density_statistics()), format_func=DENSITY_STATISTICS.get,
+        )
+    with density_col_2:
+        density_resolution = st.select_slider("Cell size (m)", DENSITY_RESOLUTIONS, value=1000)
+
+# Generate and display map. The base map keeps the same arguments per site, date pair and
+# tile option, so it renders identically on every run and st_folium keeps the mounted map;
+# only the icebergs layer changes, growing with the area the user has panned over
+# (st_folium reports the bounds and zoom of the map on every move). The map is rebuilt on
+# each run: st_folium adds the layers to the map it is given, so a map kept in the session
+# would collect the layers of every rerun.
+MAP_WIDTH, MAP_HEIGHT, MAP_ZOOM = 800, 600, 12
 if selected_icebergs:
-    map_object = iceberg_map(
-        glacier_sites,
-        site_id,
-        early_date,
-        later_date,
+    map_key = f"spatial_map_{site_id}_{date_pair}_{show_catalog}"
+    location_key, loaded_key = f"{map_key}_location", f"{map_key}_loaded"
+    # Start on the last iceberg of the date pair
+    location = st.session_state.setdefault(
+        location_key, [pair_icebergs["centroid_lat"].iloc[-1], pair_icebergs["centroid_lon"].iloc[-1]]
+    )
+    base_map = iceberg_base_map(
+        glacier_sites, site_id, location, MAP_ZOOM, tile_url=start_tile_server() if show_catalog else None,
     )
-    st_folium(map_object, width=800, height=600)
-    
+
+    view = st.session_state.get(map_key) or {}
+    zoom = view.get("zoom") or MAP_ZOOM
+    bounds = folium_bounds(view.get("bounds")) or viewport_bounds(*base_map.location, MAP_ZOOM, MAP_WIDTH, MAP_HEIGHT)
+
+    if plot_option == "Select specific icebergs":
+        loaded = set(selected_icebergs)
+    else:
+        loaded = st.session_state.setdefault(loaded_key, set())
+        loaded.update(icebergs_in_view(site_id, early_date, later_date, bounds)["shapefile"])
+    icebergs = pair_icebergs[pair_icebergs["shapefile"].isin(loaded)]
+
+    layers = [iceberg_layer(icebergs, early_date, later_date, f"{site_id} {date_pair}", zoom=zoom)]
+    if show_drift:
+        # Early icebergs matched to later ones by position, area and shape (modules.drift)
+        drift = load_drift(site_id, date_pair)
+        layers.append(drift_layer(drift[drift["early_shapefile"].isin(icebergs["shapefile"])]))
+    if show_density:
+        layers.insert(0, density_layer(density_statistic, density_resolution, region=region,
+                                       name=f"{DENSITY_STATISTICS[density_statistic]} ({region})",
+                                       log=density_statistic != "melt_rate"))
+    with span("folium.st_folium"):
+        st_folium(
+            base_map,
+            key=map_key,
+            width=MAP_WIDTH,
+            height=MAP_HEIGHT,
+            feature_group_to_add=layers,
+            returned_objects=["bounds", "zoom"],
+        )
+    if plot_option != "Select specific icebergs" and len(icebergs) < len(pair_icebergs):
+        st.caption(f"{len(icebergs)} of {len(pair_icebergs)} icebergs loaded, pan or zoom out to load more.")
+    if show_drift:
+        with st.expander("Drift of matched icebergs", expanded=False):
+            st.caption(
+                f"{len(drift)} icebergs matched, median drift {drift['distance'].median():.0f} m "
+                f"({drift['speed'].median():.0f} m/day)" if len(drift) else "No icebergs could be matched."
+            )
+            st.dataframe(drift.drop(columns=["early_lon", "early_lat", "later_lon", "later_lat"]).round(2), hide_index=True)
 else:
     st.write("")
@@ -1,15 +1,27 @@
 import streamlit as st
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
 import os
 
+import pandas as pd
+
+from modules.data_path import CATALOG_INDEX_PATH, MELT_STORE_PATH
+from modules.density import DENSITY_RESOLUTIONS, DENSITY_STATISTICS, density_grid, density_statistics
+from modules.figure_cache import (
+    correlogram_figure,
+    density_figure,
+    group_correlogram_figure,
+    size_distribution_figure,
+)
+from modules.loaders import load_glacier_sites, load_melt_preview, load_melt_statistics, melt_rates_path
+from modules.melt_store import GROUP_COLUMNS, group_summary, load_melt_store, melt_value_columns
+from modules.size_distribution import SIZE_GROUP_COLUMNS, area_distributions, melt_distributions
+
 # Title and introductory information
 st.title('📊 Iceberg Statistics Dashboard')
 st.info('Click here for the [Fjord Abbreviation List & Paired Dates](https://docs.google.com/spreadsheets/d/1kCcKqf717kK3_Xx-GDe0f61jhlUpZ5n6BN1qtiw7S4w/edit?gid=0#gid=0)')
 
-# Base directory where data is stored
-base_path = "catalog-data/Melt-rates"
+# Sites and date pairs come from the consolidated melt-rate store
+melt_store = load_melt_store()
+sites = sorted(melt_store["site"].unique()) or ["KOG", "SEK", "ASG"]
 
 # User interactions
 with st.container():
@@ -17,58 +29,146 @@ with st.container():
     menu_col1, menu_col2, menu_col3 = st.columns(3)
 
 with menu_col1:
-    site_name = st.selectbox("Select Site Name:", ["KOG", "SEK", "ASG"], index=0)  # Default is "KOG"
+    site_name = st.selectbox("Select Site Name:", sites, index=0)
+
+# Default to the first date pair with melt rates for the site
+site_pairs = sorted(melt_store.loc[melt_store["site"] == site_name, "date_pair"].unique())
+default_early, default_later = site_pairs[0].split("-") if site_pairs else ("20170515", "20170611")
 with menu_col2:
-    early_date = st.text_input("Enter Early Date (YYYYMMDD):", "20170515")  #Default date
+    early_date = st.text_input("Enter Early Date (YYYYMMDD):", default_early)
 with menu_col3:
-    later_date = st.text_input("Enter Later Date (YYYYMMDD):", "20170611")
+    later_date = st.text_input("Enter Later Date (YYYYMMDD):", default_later)
 
 # Construct folder and file paths
 if site_name and early_date and later_date:
-    folder_path = os.path.join(base_path, site_name, f"{early_date}-{later_date}")
-    csv_file_name = f"{site_name}_{early_date}-{later_date}_iceberg_meltinfo.csv"
-    csv_file_path = os.path.join(folder_path, csv_file_name)
+    csv_file_path = melt_rates_path(site_name, early_date, later_date)
 
     # Check if file exists
     if os.path.exists(csv_file_path):
-        # Load the CSV file
-        df = pd.read_csv(csv_file_path)
+        # Only a preview is loaded, the correlogram below is computed by streaming the file
+        preview = load_melt_preview(csv_file_path)
+        stats = load_melt_statistics(csv_file_path)
         st.write("### Iceberg Meltrate Information:")
-        st.dataframe(df)
+        st.dataframe(preview)
+        if stats["rows"] > len(preview):
+            st.caption(f"Showing the first {len(preview):,} of {stats['rows']:,} icebergs, download the file for all of them.")
 
-        # Add a save button for the melt rate table
-        csv_data = df.to_csv(index=False)
-        st.download_button(
-            label="Download .csv file",
-            data=csv_data,
-            file_name="iceberg_melt_rates.csv",
-            mime="text/csv",
-        )
+        # Add a save button for the melt rate table. The file is only read when asked for,
+        # and sent as is instead of being serialized again from a DataFrame.
+        download_key = f"melt_download_{csv_file_path}"
+        if st.session_state.get(download_key):
+            with open(csv_file_path, "rb") as csv_file:
+                st.download_button(
+                    label="Download .csv file",
+                    data=csv_file,
+                    file_name="iceberg_melt_rates.csv",
+                    mime="text/csv",
+                )
+        elif st.button("Prepare .csv download"):
+            st.session_state[download_key] = True
+            st.rerun()
 
-        # Drop unwanted columns
-        unwanted_columns = ['X_i', 'Y_i', 'TimeSeparation', 'VerticalAdjustment_i', 'VerticalAdjustment_f', 'Density_i', 'Density_f']
-        df = df.drop(columns=[col for col in unwanted_columns if col in df.columns])
-
-        # Display the correlogram
+        # Display the correlogram, rendered once per melt-rate table and then served from the figure cache
         st.write("### Correlogram of Iceberg Features")
-        fig, ax = plt.subplots(figsize=(10, 8))
-        sns.heatmap(df.corr(), annot=True, fmt=".2f", cmap="coolwarm", ax=ax)
-        st.pyplot(fig)
-
-        # Save correlogram as an image
-        correlogram_path = "catalog-data/correlogram.png"
-        fig.savefig(correlogram_path)
+        correlogram_png = correlogram_figure(csv_file_path)
+        st.image(correlogram_png)
 
         # Add a save button for the correlogram
-        with open(correlogram_path, "rb") as img_file:
-            st.download_button(
-                label="Download as a .png image",
-                data=img_file,
-                file_name="correlogram.png",
-                mime="image/png",
-            )
+        st.download_button(
+            label="Download as a .png image",
+            data=correlogram_png,
+            file_name="correlogram.png",
+            mime="image/png",
+        )
     else:
         # Clear the GIF if file not found, but show error
         st.error("🚫 CSV file not found. Please check your inputs! 🚫")
 else:
     st.warning("⚠️ Please provide all inputs: Site Name, Early Date, and Later Date.")
+
+# Size distributions of the whole catalog, binned and fitted once per catalog version
+st.header("Iceberg size distributions")
+AREA_SOURCE = "Outline area (catalog)"
+size_col1, size_col2 = st.columns(2)
+with size_col1:
+    # Outlines have no thickness, volumes come from the melt-rate tables
+    size_source = st.selectbox("Size:", [AREA_SOURCE] + melt_value_columns(melt_store))
+with size_col2:
+    size_group_by = st.multiselect(
+        "Group sizes by:", SIZE_GROUP_COLUMNS, default=["site"], format_func=str.capitalize,
+    )
+
+if size_group_by:
+    if size_source == AREA_SOURCE:
+        distributions = area_distributions(size_group_by)
+        size_data, size_label = CATALOG_INDEX_PATH, "Area (m²)"
+    else:
+        distributions = melt_distributions(size_group_by, size_source)
+        size_data, size_label = MELT_STORE_PATH, size_source
+    size_groups = list(distributions["fits"].index)
+    shown_groups = st.multiselect("Show:", size_groups, default=size_groups[:6])
+    if shown_groups:
+        st.image(size_distribution_figure(distributions, size_data, size_group_by, shown_groups, size_label))
+        st.caption(
+            "Power law fitted above the rollover (alpha, p(x) ~ x^-alpha) and tapered power law "
+            "(beta, corner) as fragmentation fit, both by maximum likelihood."
+        )
+        st.dataframe(distributions["fits"].loc[shown_groups])
+else:
+    st.info("Choose at least one column to group by.")
+
+# Region-wide density maps: icebergs are binned into cells, so any number of them draws as fast
+st.header("Iceberg density maps")
+density_col1, density_col2, density_col3 = st.columns(3)
+with density_col1:
+    density_region = st.selectbox("Region:", ["All regions"] + sorted(load_glacier_sites()["Region"].dropna().unique()))
+with density_col2:
+    density_statistic = st.selectbox("Density of:", list(density_statistics(melt_store)), format_func=DENSITY_STATISTICS.get)
+with density_col3:
+    density_resolution = st.select_slider("Cell size (m):", DENSITY_RESOLUTIONS, value=1000)
+
+density = density_grid(
+    density_statistic, density_resolution, region=None if density_region == "All regions" else density_region,
+)
+if density is None:
+    st.info("No icebergs in this region.")
+else:
+    st.image(density_figure(density, DENSITY_STATISTICS[density_statistic], log=density_statistic != "melt_rate"))
+
+# Cross-site comparison, served from summaries precomputed over every melt-rate table
+st.header("Compare sites, regions and seasons")
+value_columns = melt_value_columns(melt_store)
+if melt_store.empty or not value_columns:
+    st.warning("No melt-rate tables found.")
+    st.stop()
+
+compare_col1, compare_col2 = st.columns(2)
+with compare_col1:
+    group_by = st.multiselect(
+        "Group by:", GROUP_COLUMNS, default=["region"], format_func=str.capitalize,
+    )
+with compare_col2:
+    metric = st.selectbox(
+        "Metric:", value_columns, index=value_columns.index("MeltRate") if "MeltRate" in value_columns else 0,
+    )
+
+if not group_by:
+    st.info("Choose at least one column to group by.")
+    st.stop()
+
+summary = group_summary(group_by)[metric]
+groups = list(summary.index)
+labels = {group: " / ".join(map(str, group if isinstance(group, tuple) else (group,))) for group in groups}
+selected_groups = st.multiselect("Compare:", groups, default=groups, format_func=labels.get)
+if not selected_groups:
+    st.info("Choose at least one group to compare.")
+    st.stop()
+
+summary = summary.loc[selected_groups]
+st.dataframe(summary)
+means = pd.DataFrame({"group": [labels[group] for group in selected_groups], "mean": summary["mean"].to_numpy()})
+st.bar_chart(means, x="group", y="mean", x_label=" / ".join(group_by), y_label=f"Mean {metric}")
+
+correlogram_group = st.selectbox("Correlogram of:", selected_groups, format_func=labels.get)
+group_key = correlogram_group if isinstance(correlogram_group, tuple) else (correlogram_group,)
+st.image(group_correlogram_figure(group_by, group_key))
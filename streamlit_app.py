@@ -1,4 +1,7 @@
 import streamlit as st
+
+from modules.instrumentation import debug_panel, debug_requested, page_run
+
 # Application entry point
 #
 # # Site structure
@@ -30,4 +33,12 @@ pg = st.navigation(
     }
 )
 
-pg.run()
+# Time every stage of the page render, see modules/instrumentation.py. A page that fails
+# or calls st.rerun() leaves pg.run() with an exception: the panel is drawn all the same.
+# After st.stop() Streamlit draws nothing more, the run is only timed (and logged).
+try:
+    with page_run(pg.title) as run:
+        pg.run()
+finally:
+    if debug_requested():
+        debug_panel(run)